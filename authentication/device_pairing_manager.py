@@ -18,12 +18,12 @@ class DevicePairingManager(metaclass=Singleton):
         self.save_callback = save_callback  # Callback to save data
 
     def pair_device(self, username: str, device_id: str) -> bool:
-        if username not in self.authenticator.users:
+        user_account = self.authenticator.users.get(username)
+        if user_account is None:
             self.logger.warning(f"User {username} does not exist")
             return False
-        user_account = self.authenticator.users[username]
         if device_id not in user_account.paired_devices:
-            user_account.paired_devices.append(device_id)
+            user_account.paired_devices.add(device_id)
             self.logger.info(f"Device '{device_id}' paired with user '{username}'")
             if self.save_callback:
                 self.save_callback()
@@ -32,12 +32,12 @@ class DevicePairingManager(metaclass=Singleton):
         return False
 
     def authorize_topic(self, username: str, topic: str) -> bool:
-        if username not in self.authenticator.users:
+        user_account = self.authenticator.users.get(username)
+        if user_account is None:
             self.logger.warning(f"User {username} does not exist")
             return False
-        user_account = self.authenticator.users[username]
         if topic not in user_account.authorized_topics:
-            user_account.authorized_topics.append(topic)
+            user_account.authorized_topics.add(topic)
             self.logger.info(f"Topic '{topic}' authorized for user '{username}'")
             if self.save_callback:
                 self.save_callback()
@@ -46,12 +46,10 @@ class DevicePairingManager(metaclass=Singleton):
         return False
 
     def is_device_authorized(self, username: str, device_id: str) -> bool:
-        if username not in self.authenticator.users:
-            return False
-        return device_id in self.authenticator.users[username].paired_devices
+        user_account = self.authenticator.users.get(username)
+        return user_account is not None and device_id in user_account.paired_devices
 
     def is_topic_authorized(self, username: str, topic: str) -> bool:
-        # print("hello", username, topic, self.authenticator.users[username].authorized_topics)
-        if username not in self.authenticator.users:
-            return False
-        return topic in self.authenticator.users[username].authorized_topics
+        self.logger.debug("Topic authorization check: user=%s, topic=%s", username, topic)
+        user_account = self.authenticator.users.get(username)
+        return user_account is not None and topic in user_account.authorized_topics
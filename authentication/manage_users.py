@@ -31,12 +31,9 @@ def load_user_data(authenticator: UserAuthenticator, device_manager: DevicePairi
                 user_account = UserAccount(username, password='')  # Temporary password
                 user_account.password_hash = password_hash  # Set the hashed password directly
                 authenticator.users[username] = user_account
-                # Restore paired devices
-                for device_id in info.get('paired_devices', []):
-                    device_manager.pair_device(username, device_id)
-                # Restore authorized topics
-                for topic in info.get('authorized_topics', []):
-                    device_manager.authorize_topic(username, topic)
+                # Restore directly rather than through the pairing manager (no per-entry logging)
+                user_account.paired_devices.update(info.get('paired_devices', []))
+                user_account.authorized_topics.update(info.get('authorized_topics', []))
         logger.info("Loaded user data from file.")
     else:
         logger.info("No existing user data found. Starting fresh.")
@@ -46,11 +43,11 @@ def save_user_data(authenticator: UserAuthenticator, device_manager: DevicePairi
     for username, user in authenticator.users.items():
         data['users'][username] = {
             'password_hash': base64.b64encode(user.password_hash).decode('utf-8'),
-            'paired_devices': user.paired_devices,
-            'authorized_topics': user.authorized_topics
+            'paired_devices': sorted(user.paired_devices),
+            'authorized_topics': sorted(user.authorized_topics)
         }
     with open(USER_DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+        json.dump(data, f, separators=(',', ':'))
     logger.info("Saved user data to file.")
 
 def main():
@@ -130,7 +127,7 @@ def main():
         if args.username not in authenticator.users:
             logger.error(f"User '{args.username}' does not exist.")
         else:
-            del authenticator.users[args.username]
+            authenticator.remove(args.username)
             logger.info(f"User '{args.username}' removed successfully.")
             save_user_data(authenticator, device_manager)
     
@@ -1,12 +1,21 @@
-import logging
 import hashlib
+import logging
+import os
+import time
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, Set
 
 import bcrypt
 
 from utils.singleton import Singleton
 
+# How long a successful bcrypt check lets the same credentials skip the KDF, in seconds
+VERIFIED_TTL = 300.0
+# Successful checks remembered per account
+VERIFIED_CACHE_SIZE = 4
+# Keys the cache digests, so they cannot be brute-forced offline from a memory dump
+_CACHE_SECRET = os.urandom(32)
+
 
 @dataclass
 class Users:
@@ -17,25 +26,47 @@ class Users:
 class UserAccount:
     username: str
     password_hash: bytes  # Store hash as bytes
-    paired_devices: List[str] = field(default_factory=list)
-    authorized_topics: List[str] = field(default_factory=list)
+    paired_devices: Set[str] = field(default_factory=set)
+    authorized_topics: Set[str] = field(default_factory=set)
+    # Keyed digest of recently verified credentials -> expiry; failed checks are never cached
+    _verified: Dict[bytes, float] = field(default_factory=dict, repr=False, compare=False)
 
     def __init__(self, username: str, password: str):
         self.username = username
         self.password_hash = self._hash_password(password)
-        self.paired_devices = []
-        self.authorized_topics = []
+        self.paired_devices = set()
+        self.authorized_topics = set()
+        self._verified = {}
 
     def _hash_password(self, password: str) -> bytes:
         return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
+    def set_password(self, password: str):
+        self.password_hash = self._hash_password(password)
+        self._verified.clear()
+
     def verify_password(self, password: str) -> bool:
+        """
+        bcrypt check, skipped for credentials that passed it within VERIFIED_TTL.
+        The stored hash is part of the digest, so replacing it also misses the cache.
+        """
+        password_bytes = password.encode('utf-8')
+        digest = hashlib.blake2b(self.password_hash + password_bytes, key=_CACHE_SECRET).digest()
+        now = time.monotonic()
+        expiry = self._verified.get(digest)
+        if expiry is not None and expiry > now:
+            return True
         try:
-            return bcrypt.checkpw(password.encode('utf-8'), self.password_hash)
+            verified = bcrypt.checkpw(password_bytes, self.password_hash)
         except ValueError as e:
             self.logger = logging.getLogger('UserAccount')
             self.logger.error(f"Password verification failed: {e}")
             return False
+        if verified:
+            if len(self._verified) >= VERIFIED_CACHE_SIZE:
+                self._verified.clear()
+            self._verified[digest] = now + VERIFIED_TTL
+        return verified
 
 class UserAuthenticator(metaclass=Singleton):
     def __init__(self, save_callback=None):
@@ -64,4 +95,23 @@ class UserAuthenticator(metaclass=Singleton):
         self.logger.warning(f"Invalid password for user {username}")
         return False
 
-    # Optionally, implement methods to remove or modify users with save_callback
+    def change_password(self, username: str, password: str) -> bool:
+        if username not in self.users:
+            self.logger.warning(f"User {username} does not exist")
+            return False
+        self.users[username].set_password(password)
+        self.logger.info(f"Password changed for user {username}")
+        if self.save_callback:
+            self.save_callback()
+        return True
+
+    def remove(self, username: str) -> bool:
+        user_account = self.users.pop(username, None)
+        if user_account is None:
+            self.logger.warning(f"User {username} does not exist")
+            return False
+        user_account._verified.clear()
+        self.logger.info(f"User {username} removed")
+        if self.save_callback:
+            self.save_callback()
+        return True
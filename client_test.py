@@ -1,5 +1,5 @@
 import asyncio
-from connection.client import Client
+from connection.client import Client, use_io_uring_loop
 
 async def main():
     # Create the client instance
@@ -34,5 +34,6 @@ async def main():
         pass
 
 if __name__ == "__main__":
-    # Run the asyncio event loop
+    # Run the asyncio event loop (io_uring-backed when uringcore is installed)
+    use_io_uring_loop()
     asyncio.run(main())
@@ -5,50 +5,102 @@ import asyncio
 import logging
 import json
 import base64
-from collections import defaultdict
-from typing import Set, Dict, List
+import weakref
+from collections import OrderedDict
+from typing import Optional, Set, Dict, Tuple
 from dataclasses import dataclass, field
 
 from authentication.user_auth import UserAuthenticator
 from authentication.device_pairing_manager import DevicePairingManager
 from authentication.user_auth import UserAccount
-from messages.publish import PublishMessage
+from connection.topic_trie import TopicTrie
 from utils.singleton import Singleton
 
+# Upper bound on messages held for one offline persistent session; the oldest are dropped first
+MAX_QUEUED_MESSAGES = 1000
+# Seconds to collect user-store edits before writing users.json once
+USER_DATA_SAVE_DELAY = 1.0
+# Offline-queue dedup key: (packet_id, topic, payload) of the PUBLISH
+MessageKey = Tuple[Optional[int], str, bytes]
+
 @dataclass
 class SessionData:
     subscriptions: Set[str] = field(default_factory=set)
-    queued_messages: List[PublishMessage] = field(default_factory=list)
-    queued_message_ids: Set[str] = field(default_factory=set)
+    # dedup key -> (topic, packed PUBLISH bytes), in arrival order; packed once at publish time
+    queued_messages: OrderedDict[MessageKey, Tuple[str, bytes]] = field(default_factory=OrderedDict)
+
+    def queue_message(self, message_id: MessageKey, topic: str, packed: bytes) -> bool:
+        """Queue a packed PUBLISH unless it is already queued. Returns False for duplicates."""
+        queue = self.queued_messages
+        if message_id in queue:
+            return False
+        if len(queue) >= MAX_QUEUED_MESSAGES:
+            queue.popitem(last=False)  # drop the oldest
+        queue[message_id] = (topic, packed)
+        return True
+
+    def take_queued_messages(self) -> OrderedDict[MessageKey, Tuple[str, bytes]]:
+        """Hand over the whole queue at once and start a fresh one."""
+        queued = self.queued_messages
+        self.queued_messages = OrderedDict()
+        return queued
 
 class Broker(metaclass=Singleton):
     def __init__(self, authentication: bool = False):
-        # Global subscription registry: topic -> set of StreamWriter objects
-        self.subscriptions: defaultdict[str, Set[asyncio.StreamWriter]] = defaultdict(set)
-        # Track each client's subscribed topics: StreamWriter -> set of topics
-        self.client_subscriptions: defaultdict[asyncio.StreamWriter, Set[str]] = defaultdict(set)
+        # Global subscription registry: topic filter (may contain +/#) -> set of StreamWriter objects
+        self.subscriptions: TopicTrie = TopicTrie()
+        # Track each client's subscribed topics: StreamWriter -> set of topics (created on CONNECT)
+        self.client_subscriptions: Dict[asyncio.StreamWriter, Set[str]] = {}
         # Session registry: client_id -> SessionData
         self.sessions: Dict[str, SessionData] = {}
         # Connected clients: client_id -> StreamWriter
         self.connected_clients: Dict[str, asyncio.StreamWriter] = {}
-        # Reverse mapping: StreamWriter -> client_id
-        self.writer_to_client_id: Dict[asyncio.StreamWriter, str] = {}
-        # Lock to manage concurrent access
-        self.lock = asyncio.Lock()
+        # Persistent sessions of disconnected clients: topic filter -> set of client_ids
+        self.offline_subscriptions: TopicTrie = TopicTrie()
+        # Guards subscriptions / client_subscriptions; never await while holding it,
+        # since PUBLISH reads the trie without taking it
+        self.subs_lock = asyncio.Lock()
+        # Guards sessions / connected_clients
+        # (when both are needed, take sessions_lock before subs_lock)
+        self.sessions_lock = asyncio.Lock()
+        # Per-writer locks so concurrent tasks never interleave writes or drains on one socket
+        self.writer_locks: weakref.WeakKeyDictionary[asyncio.StreamWriter, asyncio.Lock] = weakref.WeakKeyDictionary()
         
         # Initialize logging
         self.logger = logging.getLogger('Broker')
         
         # Authentication
         self.authentication_enabled = authentication
+        # Set when users.json is behind the in-memory user store
+        self._user_data_dirty = False
         if self.authentication_enabled:
-            self.authenticator = UserAuthenticator(save_callback=self.save_user_data)
-            self.device_manager = DevicePairingManager(authenticator=self.authenticator, save_callback=self.save_user_data)
+            self.authenticator = UserAuthenticator(save_callback=self._user_data_changed)
+            self.device_manager = DevicePairingManager(authenticator=self.authenticator, save_callback=self._user_data_changed)
             self.load_user_data()
         else:
             self.authenticator = None
             self.device_manager = None
 
+    def writer_lock(self, writer: asyncio.StreamWriter) -> asyncio.Lock:
+        """
+        Returns the lock serializing writes to the given client, creating it on first use.
+        """
+        lock = self.writer_locks.get(writer)
+        if lock is None:
+            lock = self.writer_locks[writer] = asyncio.Lock()
+        return lock
+
+    def mark_offline(self, client_id: str, session: SessionData):
+        """
+        Indexes a persistent session's subscriptions so PUBLISH can find it without scanning all sessions.
+        """
+        for topic_filter in session.subscriptions:
+            self.offline_subscriptions.add(topic_filter, client_id)
+
+    def mark_online(self, client_id: str, session: SessionData):
+        for topic_filter in session.subscriptions:
+            self.offline_subscriptions.discard(topic_filter, client_id)
+
     def register_user(self, username: str, password: str) -> bool:
         """
         Registers a new user with the given username and password.
@@ -85,16 +137,36 @@ class Broker(metaclass=Singleton):
                     user_account = UserAccount(username, password='')  # Temporary password
                     user_account.password_hash = password_hash  # Set the hashed password directly
                     self.authenticator.users[username] = user_account
-                    # Restore paired devices
-                    for device_id in info.get('paired_devices', []):
-                        self.device_manager.pair_device(username, device_id)
-                    # Restore authorized topics
-                    for topic in info.get('authorized_topics', []):
-                        self.device_manager.authorize_topic(username, topic)
+                    # Restore directly: going through the pairing manager would re-save the file per entry
+                    user_account.paired_devices.update(info.get('paired_devices', []))
+                    user_account.authorized_topics.update(info.get('authorized_topics', []))
             self.logger.info(f"Loaded user data from {user_data_path}.")
         else:
             self.logger.info(f"No existing user data found at {user_data_path}. Starting fresh.")
 
+    def _user_data_changed(self):
+        """
+        Save callback for the authenticator and pairing manager. Marks the store dirty and,
+        inside the event loop, schedules a single save for the whole burst of edits.
+        Edits made before the loop starts are written by flush_user_data() at server start.
+        """
+        if self._user_data_dirty:
+            return
+        self._user_data_dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.call_later(USER_DATA_SAVE_DELAY, self.flush_user_data)
+
+    def flush_user_data(self):
+        """
+        Writes users.json if there are unsaved user-store edits.
+        """
+        if self._user_data_dirty:
+            self._user_data_dirty = False
+            self.save_user_data()
+
     def save_user_data(self):
         """
         Saves current user data to users.json.
@@ -104,11 +176,11 @@ class Broker(metaclass=Singleton):
         for username, user in self.authenticator.users.items():
             data['users'][username] = {
                 'password_hash': base64.b64encode(user.password_hash).decode('utf-8'),
-                'paired_devices': user.paired_devices,
-                'authorized_topics': user.authorized_topics
+                'paired_devices': sorted(user.paired_devices),
+                'authorized_topics': sorted(user.authorized_topics)
             }
         # Ensure the authentication directory exists
         user_data_path.parent.mkdir(parents=True, exist_ok=True)
         with user_data_path.open('w') as f:
-            json.dump(data, f, indent=4)
+            json.dump(data, f, separators=(',', ':'))
         self.logger.info(f"Saved user data to {user_data_path}.")
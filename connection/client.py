@@ -1,35 +1,231 @@
 # client/client.py
 
 import asyncio
+import contextlib
 import logging
+import os
+import socket
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import uringcore
+except ImportError:
+    uringcore = None
 
 from messages.base import MessageType
 from messages import (
     Message,
     Header,
     ConnectMessage, ConnAckMessage,
-    SubscribeMessage, SubAckMessage,
+    SubAckMessage,
     PublishMessage,
     PubAckMessage, PubRecMessage, PubRelMessage, PubCompMessage,
     PingReqMessage, PingRespMessage,
     DisconnectMessage
 )
+from messages.utils import U16, pack_remaining_length, pack_string
+
+SOCKET_BUFFER_SIZE = 1 << 20
+# Payloads smaller than this are never worth compressing
+COMPRESS_THRESHOLD = 1024
+# zlib wbits for a gzip container: the 1f 8b magic lets receivers recognise compressed payloads
+GZIP_WBITS = 31
+GZIP_MAGIC = b'\x1f\x8b'
+# Upper bound on an inflated payload; larger ones are rejected instead of being expanded in memory
+MAX_INFLATED_PAYLOAD_SIZE = 16 * 1024 * 1024
+# Payloads at or above this size bypass the coalescing buffer (see Client._send_large)
+LARGE_PAYLOAD_SIZE = 64 * 1024
+
+# Fixed-header bytes per (message type, qos); these never change, so build each once.
+_HEADER_CACHE: Dict[Tuple[MessageType, int], bytes] = {}
+# Acks carry nothing but a packet id, so their Remaining Length is always 2
+_ACK_REMAINING_LENGTH = pack_remaining_length(2)
+
+
+def _compress_payload(payload: bytes) -> bytes:
+    # Level 1: the broker is throughput-bound, so favour speed over ratio
+    compressor = zlib.compressobj(1, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def _decompress_payload(payload: bytes) -> Optional[bytes]:
+    """
+    Inflate gzip-framed payloads produced by publish(compress=True); anything else is returned as is.
+    Returns None when the payload would inflate past MAX_INFLATED_PAYLOAD_SIZE.
+    """
+    if not payload.startswith(GZIP_MAGIC):
+        return payload
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    try:
+        inflated = decompressor.decompress(payload, MAX_INFLATED_PAYLOAD_SIZE)
+    except zlib.error:
+        return payload
+    if decompressor.unconsumed_tail:
+        return None
+    # A truncated stream is not a payload we produced; leave it untouched
+    if not decompressor.eof:
+        return payload
+    return inflated
+
+
+def _fixed_header(message_type: MessageType, qos: int = 0) -> bytes:
+    key = (message_type, qos)
+    header = _HEADER_CACHE.get(key)
+    if header is None:
+        header = _HEADER_CACHE[key] = Header(message_type, qos=qos).pack()
+    return header
+
+
+def _ack(message_type: MessageType, packet_id: int, qos: int = 0) -> bytes:
+    """
+    PUBACK/PUBREC/PUBREL/PUBCOMP bytes from the cached fixed header, without building a message object.
+    """
+    return _fixed_header(message_type, qos) + _ACK_REMAINING_LENGTH + U16.pack(packet_id)
+
+
+def _kernel_supports_io_uring() -> bool:
+    """
+    io_uring socket ops are only reliable from Linux 5.11 onwards.
+    """
+    uname = os.uname()
+    if uname.sysname != 'Linux':
+        return False
+    try:
+        major, minor = (int(part) for part in uname.release.split('.')[:2])
+    except ValueError:
+        return False
+    return (major, minor) >= (5, 11)
+
+
+def use_io_uring_loop() -> bool:
+    """
+    Switch the event loop policy to uringcore's io_uring loop when it is installed and the kernel supports it.
+    Call before asyncio.run(); returns whether the policy was changed.
+    SQPOLL is left off: it saves syscalls for continuous PUBLISH streams but keeps a
+    kernel thread spinning, which burns CPU for bursty workloads.
+    """
+    if uringcore is None or not _kernel_supports_io_uring():
+        return False
+    asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+    return True
+
 
 class Client:
-    def __init__(self, client_id: str, username: str = None, password: str = None, host='127.0.0.1', port=1884):
+    def __init__(self, client_id: str, username: str = None, password: str = None, host='127.0.0.1', port=1884,
+                 read_buffer_size: int = 2048, write_buffer_size: int = 2048, decompress: bool = False,
+                 on_message: Optional[Callable[[str, bytes, int], None]] = None):
         self.client_id = client_id
         self.username = username
         self.password = password
         self.host = host
         self.port = port
+        # Per-connection buffer caps; asyncio's 64 KiB defaults dominate RSS with many clients
+        self.read_buffer_size = read_buffer_size
+        self.write_buffer_size = write_buffer_size
+        # Inflate payloads sent with publish(compress=True); off by default, since any payload may start with the gzip magic
+        self.decompress = decompress
+        # Called with (topic, payload, qos) for every PUBLISH received
+        self.on_message = on_message
         self.reader = None
         self.writer = None
+        # Outbound frames are coalesced here and flushed by _writer_task with a single drain
+        self._out_buf = bytearray()
+        self._flush_event = asyncio.Event()
+        self._writer_task = None
+        # Set when the writer task hits a socket error; nothing is written after that
+        self._write_error: Optional[OSError] = None
+        # topic -> length-prefixed UTF-8 bytes, reused by every PUBLISH to that topic
+        self._topic_cache: Dict[str, bytes] = {}
+        # Incoming packet type -> bound handler, looked up once per received packet
+        self._dispatch = {
+            MessageType.PUBLISH: self._handle_publish,
+            MessageType.PUBREL: self._handle_pubrel,
+            MessageType.PINGRESP: self._handle_pingresp,
+        }
         self.logger = logging.getLogger(f"Client-{self.client_id}")
 
+    def _send(self, packet: bytes):
+        """
+        Queue a packet for the writer task instead of writing and draining per frame.
+        Raises ConnectionError once the writer task has failed, rather than buffering forever.
+        """
+        self._check_writable()
+        self._out_buf += packet
+        self._flush_event.set()
+
+    def _check_writable(self):
+        if self._write_error is not None:
+            raise ConnectionError(f"Connection lost: {self._write_error}") from self._write_error
+
+    async def _flush_loop(self):
+        while True:
+            await self._flush_event.wait()
+            self._flush_event.clear()
+            buf, self._out_buf = self._out_buf, bytearray()
+            try:
+                self.writer.write(buf)
+                await self.writer.drain()
+            except OSError as e:
+                self.logger.error("Error writing to server: %s", e)
+                self._write_error = e
+                self._out_buf = bytearray()
+                return
+
+    async def _stop_writer_task(self):
+        """
+        Cancel the writer task and flush whatever is still buffered.
+        """
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, OSError):
+                await self._writer_task
+            self._writer_task = None
+        # Nothing more can be written once the transport has failed
+        if self._write_error is not None or self.writer.is_closing():
+            self._out_buf = bytearray()
+            return
+        if self._out_buf:
+            buf, self._out_buf = self._out_buf, bytearray()
+            self.writer.write(buf)
+            await self.writer.drain()
+
+    async def _abort_connect(self):
+        """
+        Tear down a half-open connection: stop the writer task, drop unsent frames and close the socket.
+        """
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, OSError):
+                await self._writer_task
+            self._writer_task = None
+        self._out_buf = bytearray()
+        self.writer.close()
+        with contextlib.suppress(OSError):
+            await self.writer.wait_closed()
+
+    def _tune_socket(self):
+        """
+        Disable Nagle and enlarge socket buffers so small control packets
+        (PINGREQ, PUBACK, SUBSCRIBE) are not held back waiting for more data.
+        """
+        sock = self.writer.get_extra_info('socket')
+        if sock is None:
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        if hasattr(socket, 'TCP_QUICKACK'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
     async def connect(self):
-        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=self.read_buffer_size)
+        self.writer.transport.set_write_buffer_limits(high=self.write_buffer_size)
         peer = self.writer.get_extra_info('peername')
         self.logger.info(f"Connected to server at {peer}")
+        self._tune_socket()
+        self._write_error = None
+        self._writer_task = asyncio.create_task(self._flush_loop())
 
         # Send CONNECT message
         connect_header = Header(MessageType.CONNECT)
@@ -48,16 +244,20 @@ class Client:
             username=self.username,
             password=self.password
         )
-        self.writer.write(connect_msg.pack())
-        await self.writer.drain()
+        self._send(connect_msg.pack())
         self.logger.info("Sent CONNECT message")
 
-        # Wait for CONNACK
-        connack: ConnAckMessage = await Message.from_reader(self.reader)
+        # Wait for CONNACK; if it never arrives (reset, malformed reply), do not leak the writer task or socket
+        try:
+            connack: ConnAckMessage = await Message.from_reader(self.reader)
+        except BaseException:
+            await self._abort_connect()
+            raise
         self.logger.info(f"Received CONNACK: session_present={connack.session_present}, return_code={connack.return_code}")
 
         if connack.return_code != 0:
             self.logger.error(f"Connection refused by server with return code {connack.return_code}")
+            await self._stop_writer_task()
             self.writer.close()
             await self.writer.wait_closed()
             return False
@@ -66,53 +266,69 @@ class Client:
 
     async def subscribe(self, topic: str, qos: int = 0):
         packet_id = 1  # This should be unique per SUBSCRIBE in a real implementation
-        subscribe_header = Header(MessageType.SUBSCRIBE, qos=1)
-        subscribe_msg = SubscribeMessage(
-            header=subscribe_header,
-            packet_id=packet_id,
-            subscriptions=[(topic, qos)]
-        )
-        self.writer.write(subscribe_msg.pack())
-        await self.writer.drain()
+        variable = U16.pack(packet_id) + pack_string(topic) + bytes([qos & 0x03])
+        self._send(_fixed_header(MessageType.SUBSCRIBE, qos=1) + pack_remaining_length(len(variable)) + variable)
         self.logger.info(f"Sent SUBSCRIBE to topic '{topic}' with QoS {qos}")
 
         # Wait for SUBACK
         suback: SubAckMessage = await Message.from_reader(self.reader)
         self.logger.info(f"Received SUBACK: packet_id={suback.packet_id}, return_codes={suback.return_codes}")
 
-    async def publish(self, topic: str, payload: str, qos: int = 0):
+    def _send_large(self, head: bytes, payload: bytes):
+        """
+        Write a large packet as separate buffers so the payload is not copied into
+        the coalescing buffer; anything already queued goes out first to keep ordering.
+        """
+        self._check_writable()
+        pending, self._out_buf = self._out_buf, bytearray()
+        self.writer.writelines([pending, head, payload])
+        self._flush_event.set()  # let the writer task apply back-pressure
+
+    def _publish_head(self, topic: str, packet_id: int, payload_len: int, qos: int) -> bytes:
+        """
+        Assemble a PUBLISH's headers from cached header and topic bytes instead of building a PublishMessage.
+        """
+        topic_bytes = self._topic_cache.get(topic)
+        if topic_bytes is None:
+            topic_bytes = self._topic_cache[topic] = pack_string(topic)
+        packet_id_bytes = U16.pack(packet_id) if qos > 0 else b""
+        remaining_length = len(topic_bytes) + len(packet_id_bytes) + payload_len
+        return b"".join([
+            _fixed_header(MessageType.PUBLISH, qos),
+            pack_remaining_length(remaining_length),
+            topic_bytes,
+            packet_id_bytes
+        ])
+
+    async def publish(self, topic: str, payload: str, qos: int = 0, compress: bool = False):
         packet_id = 2  # This should be unique per PUBLISH in a real implementation
-        publish_header = Header(MessageType.PUBLISH, qos=qos)
-        publish_msg = PublishMessage(
-            header=publish_header,
-            topic=topic,
-            packet_id=packet_id,
-            payload=payload.encode('utf-8')
-        )
-        self.writer.write(publish_msg.pack())
-        await self.writer.drain()
-        self.logger.info(f"Published to '{topic}': {payload}")
+        payload_bytes = payload.encode('utf-8')
+        if compress and len(payload_bytes) >= COMPRESS_THRESHOLD:
+            payload_bytes = _compress_payload(payload_bytes)
+        head = self._publish_head(topic, packet_id, len(payload_bytes), qos)
+        if len(payload_bytes) >= LARGE_PAYLOAD_SIZE:
+            self._send_large(head, payload_bytes)
+        else:
+            self._send(head + payload_bytes)
+        self.logger.info("Published to '%s': %s", topic, payload)
 
         # Handle QoS acknowledgments
         if qos == 1:
             # Wait for PUBACK
             puback: PubAckMessage = await Message.from_reader(self.reader)
-            self.logger.info(f"Received PUBACK for packet_id={puback.packet_id}")
+            self.logger.info("Received PUBACK for packet_id=%s", puback.packet_id)
         elif qos == 2:
             # Wait for PUBREC
             pubrec: PubRecMessage = await Message.from_reader(self.reader)
-            self.logger.info(f"Received PUBREC for packet_id={pubrec.packet_id}")
+            self.logger.info("Received PUBREC for packet_id=%s", pubrec.packet_id)
 
-            # Send PUBREL
-            pubrel_header = Header(MessageType.PUBREL, qos=1)
-            pubrel = PubRelMessage(pubrel_header, pubrec.packet_id)
-            self.writer.write(pubrel.pack())
-            await self.writer.drain()
-            self.logger.info(f"Sent PUBREL for packet_id={pubrec.packet_id}")
+            # Send PUBREL (fixed header QoS must be 1)
+            self._send(_ack(MessageType.PUBREL, pubrec.packet_id, qos=1))
+            self.logger.info("Sent PUBREL for packet_id=%s", pubrec.packet_id)
 
             # Wait for PUBCOMP
             pubcomp: PubCompMessage = await Message.from_reader(self.reader)
-            self.logger.info(f"Received PUBCOMP for packet_id={pubcomp.packet_id}")
+            self.logger.info("Received PUBCOMP for packet_id=%s", pubcomp.packet_id)
 
     async def listen(self):
         while True:
@@ -123,63 +339,66 @@ class Client:
                 self.logger.info("Server closed the connection")
                 break
             except Exception as e:
-                self.logger.error(f"Error while reading message: {e}")
+                self.logger.error("Error while reading message: %s", e)
                 break
 
     async def handle_message(self, message: Message):
         msg_type = message.header.message_type
+        handler = self._dispatch.get(msg_type)
+        if handler is None:
+            self.logger.info("Received unexpected message type=%s", msg_type)
+            return
+        await handler(message)
 
-        if msg_type == MessageType.PUBLISH:
-            publish_msg: PublishMessage = message
-            topic = publish_msg.topic
-            payload = publish_msg.payload.decode('utf-8', 'ignore')
-            qos = publish_msg.header.qos
-            self.logger.info(f"Received PUBLISH: topic='{topic}', payload='{payload}', QoS={qos}")
-
-            # Handle QoS acknowledgments
-            if qos == 1:
-                # Send PUBACK
-                puback_header = Header(MessageType.PUBACK)
-                puback = PubAckMessage(puback_header, publish_msg.packet_id)
-                self.writer.write(puback.pack())
-                await self.writer.drain()
-                self.logger.info(f"Sent PUBACK for packet_id={publish_msg.packet_id}")
+    async def _handle_publish(self, publish_msg: PublishMessage):
+        topic = publish_msg.topic
+        qos = publish_msg.header.qos
+        payload = publish_msg.payload
+        if self.decompress:
+            payload = _decompress_payload(payload)
+        if payload is None:
+            # Still acknowledged below, so the QoS flow completes; the payload is just not delivered
+            self.logger.warning("Dropped PUBLISH on '%s': payload inflates past %d bytes", topic, MAX_INFLATED_PAYLOAD_SIZE)
+        else:
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("Received PUBLISH: topic='%s', payload='%s', QoS=%s",
+                                 topic, payload.decode('utf-8', 'ignore'), qos)
+            if self.on_message is not None:
+                self.on_message(topic, payload, qos)
 
-            elif qos == 2:
-                # Send PUBREC
-                pubrec_header = Header(MessageType.PUBREC)
-                pubrec = PubRecMessage(pubrec_header, publish_msg.packet_id)
-                self.writer.write(pubrec.pack())
-                await self.writer.drain()
-                self.logger.info(f"Sent PUBREC for packet_id={publish_msg.packet_id}")
+        # Handle QoS acknowledgments
+        if qos == 1:
+            # Send PUBACK
+            self._send(_ack(MessageType.PUBACK, publish_msg.packet_id))
+            self.logger.info("Sent PUBACK for packet_id=%s", publish_msg.packet_id)
 
-        elif msg_type == MessageType.PUBREL:
-            # Handle PUBREL for QoS=2
-            pubrel_msg: PubRelMessage = message
-            self.logger.info(f"Received PUBREL: packet_id={pubrel_msg.packet_id}")
+        elif qos == 2:
+            # Send PUBREC
+            self._send(_ack(MessageType.PUBREC, publish_msg.packet_id))
+            self.logger.info("Sent PUBREC for packet_id=%s", publish_msg.packet_id)
 
-            # Send PUBCOMP
-            pubcomp_header = Header(MessageType.PUBCOMP)
-            pubcomp = PubCompMessage(pubcomp_header, pubrel_msg.packet_id)
-            self.writer.write(pubcomp.pack())
-            await self.writer.drain()
-            self.logger.info(f"Sent PUBCOMP for packet_id={pubrel_msg.packet_id}")
+    async def _handle_pubrel(self, pubrel_msg: PubRelMessage):
+        # Handle PUBREL for QoS=2
+        self.logger.info("Received PUBREL: packet_id=%s", pubrel_msg.packet_id)
 
-        elif msg_type == MessageType.PINGRESP:
-            self.logger.info("Received PINGRESP")
+        # Send PUBCOMP
+        self._send(_ack(MessageType.PUBCOMP, pubrel_msg.packet_id))
+        self.logger.info("Sent PUBCOMP for packet_id=%s", pubrel_msg.packet_id)
 
-        else:
-            self.logger.info(f"Received unexpected message type={msg_type}")
+    async def _handle_pingresp(self, message: Message):
+        self.logger.info("Received PINGRESP")
 
     async def disconnect(self):
         # Send DISCONNECT message
         disconnect_header = Header(MessageType.DISCONNECT)
         disconnect_msg = DisconnectMessage(disconnect_header)
-        self.writer.write(disconnect_msg.pack())
-        await self.writer.drain()
-        self.logger.info("Sent DISCONNECT")
+        if self._write_error is None:
+            self._send(disconnect_msg.pack())
+            self.logger.info("Sent DISCONNECT")
+        await self._stop_writer_task()
         self.writer.close()
-        await self.writer.wait_closed()
+        with contextlib.suppress(OSError):
+            await self.writer.wait_closed()
         self.logger.info("Disconnected from server")
 
     async def run(self):
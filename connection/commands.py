@@ -1,6 +1,8 @@
 # connection/commands.py
 
 from abc import ABC, abstractmethod
+import asyncio
+import contextlib
 import logging
 
 from messages.constants import MessageType
@@ -14,12 +16,57 @@ from messages import (
     PingRespMessage,
     Header
 )
+from messages.utils import U16
+
+# Upper bound on idle instances kept per Command subclass
+COMMAND_POOL_SIZE = 512
+
+# Replies that never change are packed once at import; acks only need their packet id appended
+CONNACK_ACCEPTED = ConnAckMessage(Header(MessageType.CONNACK), session_present=0, return_code=0).pack()
+CONNACK_BAD_CREDENTIALS = ConnAckMessage(Header(MessageType.CONNACK), session_present=0, return_code=4).pack()
+PINGRESP_BYTES = PingRespMessage(Header(MessageType.PINGRESP)).pack()
+PUBACK_PREFIX = PubAckMessage(Header(MessageType.PUBACK), packet_id=0).pack()[:-2]
+PUBREC_PREFIX = PubRecMessage(Header(MessageType.PUBREC), packet_id=0).pack()[:-2]
+PUBREL_PREFIX = PubRelMessage(Header(MessageType.PUBREL, qos=1), packet_id=0).pack()[:-2]
+PUBCOMP_PREFIX = PubCompMessage(Header(MessageType.PUBCOMP), packet_id=0).pack()[:-2]
+UNSUBACK_PREFIX = UnsubAckMessage(Header(MessageType.UNSUBACK), packet_id=0).pack()[:-2]
+# SUBACK length varies with the number of filters; only its header is shared (pack() never mutates it)
+SUBACK_HEADER = Header(MessageType.SUBACK)
 
 class Command(ABC):
+    logger: logging.Logger
+    _pool: list
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Resolve each command's logger once per class rather than once per packet
+        cls.logger = logging.getLogger(cls.__name__)
+        cls._pool = []
+
     def __init__(self, handler, message):
         self.handler = handler
         self.message = message
-        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def acquire(cls, handler, message) -> 'Command':
+        """
+        Reuse an idle instance from this class's pool, or build a new one.
+        """
+        if cls._pool:
+            command = cls._pool.pop()
+            command.handler = handler
+            command.message = message
+            return command
+        return cls(handler, message)
+
+    def release(self):
+        """
+        Drop references to the handler and message and return the instance to its pool.
+        """
+        self.handler = None
+        self.message = None
+        if len(self._pool) < COMMAND_POOL_SIZE:
+            self._pool.append(self)
 
     @abstractmethod
     async def execute(self):
@@ -30,287 +77,281 @@ class ConnectCommand(Command):
         connect_msg: ConnectMessage = self.message
         broker: Broker = self.handler.broker
 
-        async with broker.lock:
-            self.handler.client_id = connect_msg.client_id
-            self.handler.username = connect_msg.username
-            self.handler.clean_session = connect_msg.clean_session
-            self.logger.info(f"CONNECT: client_id={self.handler.client_id}, clean_session={self.handler.clean_session}")
-
-            # Authentication
-            if broker.authentication_enabled:
-                username = connect_msg.username
-                password = connect_msg.password
-                if not broker.authenticator.login(username, password):
-                    # Authentication failed
-                    connack = ConnAckMessage(
-                        header=Header(MessageType.CONNACK),
-                        session_present=0,
-                        return_code=4  # Bad Username or Password
-                    )
-                    self.handler.writer.write(connack.pack())
-                    await self.handler.writer.drain()
-                    self.logger.warning(f"Authentication failed for client_id={self.handler.client_id}, username={username}")
-                    self.handler.writer.close()
-                    await self.handler.writer.wait_closed()
-                    return
-
-                self.logger.info(f"Authentication successful for client_id={self.handler.client_id}, username={username}")
-
+        self.handler.client_id = connect_msg.client_id
+        self.handler.username = connect_msg.username
+        self.handler.clean_session = connect_msg.clean_session
+        self.logger.info("CONNECT: client_id=%s, clean_session=%s", self.handler.client_id, self.handler.clean_session)
+
+        # Authentication: the bcrypt check runs in a worker thread and outside the broker locks,
+        # so a slow password hash does not stall every other connection
+        if broker.authentication_enabled:
+            username = connect_msg.username
+            password = connect_msg.password
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(None, broker.authenticator.login, username, password):
+                # Authentication failed: Bad Username or Password
+                self.handler.send(CONNACK_BAD_CREDENTIALS)
+                self.handler.flush()
+                self.logger.warning("Authentication failed for client_id=%s, username=%s", self.handler.client_id, username)
+                self.handler.writer.close()
+                await self.handler.writer.wait_closed()
+                return
+
+            self.logger.info("Authentication successful for client_id=%s, username=%s", self.handler.client_id, username)
+
+        async with broker.sessions_lock:
             # Session Handling
             if not self.handler.clean_session:
-                if self.handler.client_id in broker.sessions:
-                    session = broker.sessions[self.handler.client_id]
-                    self.logger.info(f"Resuming session for client_id={self.handler.client_id}")
+                session = broker.sessions.get(self.handler.client_id)
+                if session is not None:
+                    broker.mark_online(self.handler.client_id, session)
+                    self.logger.info("Resuming session for client_id=%s", self.handler.client_id)
                 else:
                     session = SessionData()
                     broker.sessions[self.handler.client_id] = session
-                    self.logger.info(f"Creating new session for client_id={self.handler.client_id}")
+                    self.logger.info("Creating new session for client_id=%s", self.handler.client_id)
             else:
-                if self.handler.client_id in broker.sessions:
-                    del broker.sessions[self.handler.client_id]
-                    self.logger.info(f"Cleared session for client_id={self.handler.client_id}")
+                old_session = broker.sessions.pop(self.handler.client_id, None)
+                if old_session is not None:
+                    broker.mark_online(self.handler.client_id, old_session)
+                    self.logger.info("Cleared session for client_id=%s", self.handler.client_id)
                 session = SessionData()
                 broker.sessions[self.handler.client_id] = session
 
             # Handle existing connections
-            if not self.handler.clean_session and self.handler.client_id in broker.connected_clients:
-                old_writer = broker.connected_clients[self.handler.client_id]
+            old_writer = broker.connected_clients.get(self.handler.client_id) if not self.handler.clean_session else None
+            if old_writer is not None:
                 old_peer = old_writer.get_extra_info('peername')
-                self.logger.info(f"Closing existing connection for client_id={self.handler.client_id} from {old_peer}")
+                self.logger.info("Closing existing connection for client_id=%s from %s", self.handler.client_id, old_peer)
 
                 # Remove old writer from subscriptions
-                if old_writer in broker.client_subscriptions:
-                    for topic in broker.client_subscriptions[old_writer]:
-                        broker.subscriptions[topic].discard(old_writer)
-                        self.logger.info(f"Removed from topic '{topic}' subscriptions")
-                    del broker.client_subscriptions[old_writer]
-
-                # Remove from writer_to_client_id
-                if old_writer in broker.writer_to_client_id:
-                    del broker.writer_to_client_id[old_writer]
-
-                # Close old connection
+                async with broker.subs_lock:
+                    topics = broker.client_subscriptions.pop(old_writer, None)
+                    if topics:
+                        for topic in topics:
+                            broker.subscriptions.discard(topic, old_writer)
+                            self.logger.info("Removed from topic '%s' subscriptions", topic)
+
+                # Stop the old connection now; waiting for it to finish closing happens after the lock is released
                 old_writer.close()
-                await old_writer.wait_closed()
-                self.logger.info(f"Closed previous connection for client_id={self.handler.client_id}")
 
             # Mark as connected
+            async with broker.subs_lock:
+                broker.client_subscriptions[self.handler.writer] = set()
             broker.connected_clients[self.handler.client_id] = self.handler.writer
-            broker.writer_to_client_id[self.handler.writer] = self.handler.client_id
-
-            # Send CONNACK
-            connack = ConnAckMessage(
-                header=Header(MessageType.CONNACK),
-                session_present=0,
-                return_code=0  # Success
-            )
-            self.handler.writer.write(connack.pack())
-            await self.handler.writer.drain()
-            self.logger.info(f"Sent CONNACK to {self.handler.client_id}")
+
+        if old_writer is not None:
+            with contextlib.suppress(ConnectionError):
+                await old_writer.wait_closed()
+            self.logger.info("Closed previous connection for client_id=%s", self.handler.client_id)
+
+        # Send CONNACK
+        self.handler.send(CONNACK_ACCEPTED)
+        self.logger.info("Sent CONNACK to %s", self.handler.client_id)
 
 class SubscribeCommand(Command):
     async def execute(self):
         subscribe_msg: SubscribeMessage = self.message
         broker: Broker = self.handler.broker
 
-        async with broker.lock:
-            packet_id = subscribe_msg.packet_id
-            topics_qos = subscribe_msg.subscriptions  # List of (topic, qos)
-            granted_qos = []
-
-            for topic, qos in topics_qos:
-                # Authorization check
-                if broker.authentication_enabled:
-                    username = self.handler.username
-                    if not broker.device_manager.is_topic_authorized(username, topic):
-                        granted_qos.append(0x80)  # Failure QoS
-                        self.logger.warning(f"User '{username}' is not authorized to subscribe to '{topic}'")
-                        continue
-
-                # Subscribe
-                if topic not in broker.client_subscriptions[self.handler.writer]:
-                    broker.subscriptions[topic].add(self.handler.writer)
-                    broker.client_subscriptions[self.handler.writer].add(topic)
-                    broker.sessions[self.handler.client_id].subscriptions.add(topic)
-                    granted_qos.append(qos)
-                    self.logger.info(f"Subscribed to topic '{topic}' with QoS {qos}")
-
-                    # Deliver queued messages if any
-                    session = broker.sessions.get(self.handler.client_id)
-                    if session and session.queued_messages:
-                        for queued_msg in session.queued_messages:
-                            self.handler.writer.write(queued_msg.pack())
-                            await self.handler.writer.drain()
-                            self.logger.info(f"Delivered queued message to topic '{queued_msg.topic}'")
-                        session.queued_messages.clear()
-                        session.queued_message_ids.clear()
+        packet_id = subscribe_msg.packet_id
+        topics = subscribe_msg.topics
+        granted_qos = list(subscribe_msg.qos)
+        writer = self.handler.writer
+        client_id = self.handler.client_id
+        info_enabled = self.logger.isEnabledFor(logging.INFO)
+        log_info = self.logger.info
+        to_deliver = ()
+
+        # Authorization check, failing entries get the 0x80 return code
+        if broker.authentication_enabled:
+            username = self.handler.username
+            is_authorized = broker.device_manager.is_topic_authorized
+            for i, topic in enumerate(topics):
+                if not is_authorized(username, topic):
+                    granted_qos[i] = 0x80  # Failure QoS
+                    self.logger.warning("User '%s' is not authorized to subscribe to '%s'", username, topic)
+
+        # Update the registries under the locks, but write to the socket only after releasing them
+        async with broker.sessions_lock, broker.subs_lock:
+            # A takeover has already handed client_id to a newer connection: this one is closing,
+            # and must neither re-register its writer nor drain the new owner's queued messages
+            if broker.connected_clients.get(client_id) is not writer:
+                self.logger.warning("Dropped SUBSCRIBE from superseded connection for client_id=%s", client_id)
+                return
+            # Registered at CONNECT, and removed together with connected_clients on cleanup
+            my_subs = broker.client_subscriptions[writer]
+            # dict.fromkeys keeps packet order and drops repeated filters
+            to_add = list(dict.fromkeys(
+                topic for topic, code in zip(topics, granted_qos)
+                if code != 0x80 and topic not in my_subs
+            ))
+            if to_add:
+                my_subs.update(to_add)
+                session = broker.sessions[client_id]
+                session.subscriptions.update(to_add)
+                subscriptions = broker.subscriptions
+                for topic in to_add:
+                    subscriptions.add(topic, writer)
+
+                # Take queued messages if any
+                if session.queued_messages:
+                    to_deliver = session.take_queued_messages().values()
+
+        if info_enabled:
+            added = set(to_add)
+            for topic, code in zip(topics, granted_qos):
+                if code == 0x80:
+                    continue
+                if topic in added:
+                    log_info("Subscribed to topic '%s' with QoS %s", topic, code)
                 else:
-                    # Already subscribed, append current QoS
-                    granted_qos.append(qos)
-                    self.logger.info(f"Already subscribed to topic '{topic}', updated QoS to {qos}")
-
-            # Send SUBACK
-            suback = SubAckMessage(
-                header=Header(MessageType.SUBACK),
-                packet_id=packet_id,
-                return_codes=granted_qos
-            )
-            self.handler.writer.write(suback.pack())
-            await self.handler.writer.drain()
-            self.logger.info(f"Sent SUBACK for packet_id={packet_id}")
+                    log_info("Already subscribed to topic '%s', updated QoS to %s", topic, code)
+
+        # Queued messages and the SUBACK are coalesced into the handler's next flush
+        send = self.handler.send
+        for queued_topic, packed in to_deliver:
+            send(packed)
+            if info_enabled:
+                log_info("Delivered queued message to topic '%s'", queued_topic)
+
+        suback = SubAckMessage(
+            header=SUBACK_HEADER,
+            packet_id=packet_id,
+            return_codes=granted_qos
+        )
+        send(suback.pack())
+        self.logger.info("Sent SUBACK for packet_id=%s", packet_id)
 
 class UnsubscribeCommand(Command):
     async def execute(self):
         unsubscribe_msg: UnsubscribeMessage = self.message
         broker: Broker = self.handler.broker
 
-        async with broker.lock:
-            packet_id = unsubscribe_msg.packet_id
-            topics = unsubscribe_msg.topics
+        packet_id = unsubscribe_msg.packet_id
+        topics = unsubscribe_msg.topics
 
+        async with broker.sessions_lock, broker.subs_lock:
+            writer = self.handler.writer
+            my_subs = broker.client_subscriptions.get(writer, set())
             for topic in topics:
-                if topic in broker.client_subscriptions[self.handler.writer]:
-                    broker.subscriptions[topic].discard(self.handler.writer)
-                    broker.client_subscriptions[self.handler.writer].discard(topic)
+                if topic in my_subs:
+                    broker.subscriptions.discard(topic, writer)
+                    my_subs.discard(topic)
                     broker.sessions[self.handler.client_id].subscriptions.discard(topic)
-                    self.logger.info(f"Unsubscribed from topic '{topic}'")
+                    self.logger.info("Unsubscribed from topic '%s'", topic)
                 else:
-                    self.logger.info(f"Attempted to unsubscribe from non-subscribed topic '{topic}'")
+                    self.logger.info("Attempted to unsubscribe from non-subscribed topic '%s'", topic)
 
-            # Send UNSUBACK
-            unsuback = UnsubAckMessage(
-                header=Header(MessageType.UNSUBACK),
-                packet_id=packet_id
-            )
-            self.handler.writer.write(unsuback.pack())
-            await self.handler.writer.drain()
-            self.logger.info(f"Sent UNSUBACK for packet_id={packet_id}")
+        # Send UNSUBACK
+        self.handler.send(UNSUBACK_PREFIX + U16.pack(packet_id))
+        self.logger.info("Sent UNSUBACK for packet_id=%s", packet_id)
 
 class PublishCommand(Command):
     async def execute(self):
         publish_msg: PublishMessage = self.message
         broker: Broker = self.handler.broker
-
-        async with broker.lock:
-            topic = publish_msg.topic
-            payload = publish_msg.payload
-            qos = publish_msg.header.qos
-
-            try:
-                payload_str = payload.decode('utf-8')
-            except UnicodeDecodeError:
-                payload_str = payload.decode('utf-8', 'ignore')
-
-            self.logger.info(f"PUBLISH: topic='{topic}', payload='{payload_str}', QoS={qos}")
-
-            # Authorization check
-            if broker.authentication_enabled:
-                username = self.handler.username
-                if not broker.device_manager.is_topic_authorized(username, topic):
-                    self.logger.warning(f"User '{username}' is not authorized to publish to '{topic}'")
-                    # Optionally, send an error or ignore
-                    return
-
-            # Forward to subscribers
-            if topic in broker.subscriptions:
-                for subscriber in list(broker.subscriptions[topic]):
-                    if subscriber != self.handler.writer:
-                        try:
-                            subscriber.write(publish_msg.pack())
-                            await subscriber.drain()
-                            self.logger.info(f"Forwarded PUBLISH to subscriber {subscriber.get_extra_info('peername')}")
-                        except Exception as e:
-                            self.logger.error(f"Error forwarding PUBLISH to subscriber: {e}")
-            else:
-                self.logger.info(f"No subscribers for topic '{topic}'")
-
-            # Handle offline subscribers
-            for offline_client_id, session in broker.sessions.items():
-                if offline_client_id not in broker.connected_clients and topic in session.subscriptions:
-                    # Queue the message based on QoS
-                    if qos in [1, 2]:
-                        message_id = f"{publish_msg.packet_id}-{topic}-{payload_str}"
-                        if message_id not in session.queued_message_ids:
-                            session.queued_messages.append(publish_msg)
-                            session.queued_message_ids.add(message_id)
-                            self.logger.info(f"Queued PUBLISH for offline client_id={offline_client_id}, topic='{topic}'")
-                        else:
-                            self.logger.info(f"PUBLISH already queued for client_id={offline_client_id}, topic='{topic}'")
-
-            # Handle QoS acknowledgments
-            if qos == 1:
-                puback = PubAckMessage(
-                    header=Header(MessageType.PUBACK),
-                    packet_id=publish_msg.packet_id
-                )
-                self.handler.writer.write(puback.pack())
-                await self.handler.writer.drain()
-                self.logger.info(f"Sent PUBACK for packet_id={publish_msg.packet_id}")
-            elif qos == 2:
-                pubrec = PubRecMessage(
-                    header=Header(MessageType.PUBREC),
-                    packet_id=publish_msg.packet_id
-                )
-                self.handler.writer.write(pubrec.pack())
-                await self.handler.writer.drain()
-                self.logger.info(f"Sent PUBREC for packet_id={publish_msg.packet_id}")
+        # Hot-loop lookups bound to locals once
+        writer = self.handler.writer
+        # Per-packet chatter is DEBUG; the guard also skips building its arguments (hex preview, peername)
+        log_debug = self.logger.debug
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+
+        topic = publish_msg.topic
+        payload = publish_msg.payload
+        qos = publish_msg.header.qos
+
+        # Payloads are arbitrary bytes: log their size and a short hex prefix instead of decoding them
+        if debug_enabled:
+            log_debug("PUBLISH: topic='%s', payload=%d bytes (%s), QoS=%s", topic, len(payload), payload[:32].hex(), qos)
+
+        # Authorization check
+        if broker.authentication_enabled:
+            username = self.handler.username
+            if not broker.device_manager.is_topic_authorized(username, topic):
+                self.logger.warning("User '%s' is not authorized to publish to '%s'", username, topic)
+                # Optionally, send an error or ignore
+                return
+
+        # Serialize once; the same bytes go to every subscriber and offline queue
+        packed = publish_msg.pack()
+
+        # No lock needed: every subs_lock holder mutates the trie without awaiting in between,
+        # so this synchronous match always sees a consistent snapshot
+        subscribers = broker.subscriptions.match(topic)
+
+        # Forward to subscribers: frames are queued on the handler and written per subscriber
+        # with one writelines() at the end of the batch, then drained concurrently
+        if subscribers:
+            forward = self.handler.forward
+            for subscriber in subscribers:
+                # Writers already closing belong to connections whose cleanup is pending; skip them
+                if subscriber is not writer and not subscriber.is_closing():
+                    forward(subscriber, packed)
+                    if debug_enabled:
+                        log_debug("Forwarded PUBLISH to subscriber %s", subscriber.get_extra_info('peername'))
+        else:
+            self.logger.debug("No subscribers for topic '%s'", topic)
+
+        # Handle offline subscribers: queue the message based on QoS
+        # (skipped without touching sessions_lock while no persistent session is offline)
+        if qos in [1, 2] and broker.offline_subscriptions:
+            async with broker.sessions_lock:
+                targets = broker.offline_subscriptions.match(topic)
+                if targets:
+                    # Exact dedup key: hashable like a bare hash(), but two different messages can never collide
+                    message_id = (publish_msg.packet_id, topic, payload)
+                    sessions = broker.sessions
+                    queued = [cid for cid in targets if sessions[cid].queue_message(message_id, topic, packed)]
+                    if debug_enabled:
+                        for offline_client_id in queued:
+                            log_debug("Queued PUBLISH for offline client_id=%s, topic='%s'", offline_client_id, topic)
+                        if len(queued) < len(targets):
+                            log_debug("PUBLISH already queued for %d offline client(s), topic='%s'", len(targets) - len(queued), topic)
+
+        # Handle QoS acknowledgments
+        if qos == 1:
+            self.handler.send(PUBACK_PREFIX + U16.pack(publish_msg.packet_id))
+            self.logger.debug("Sent PUBACK for packet_id=%s", publish_msg.packet_id)
+        elif qos == 2:
+            self.handler.send(PUBREC_PREFIX + U16.pack(publish_msg.packet_id))
+            self.logger.debug("Sent PUBREC for packet_id=%s", publish_msg.packet_id)
 
 class PubRecCommand(Command):
     async def execute(self):
         pubrec_msg: PubRecMessage = self.message
-        broker: Broker = self.handler.broker
 
-        async with broker.lock:
-            packet_id = pubrec_msg.packet_id
-            self.logger.info(f"PUBREC: packet_id={packet_id}")
+        packet_id = pubrec_msg.packet_id
+        self.logger.debug("PUBREC: packet_id=%s", packet_id)
 
-            # Respond with PUBREL
-            pubrel = PubRelMessage(
-                header=Header(MessageType.PUBREL, qos=1),
-                packet_id=packet_id
-            )
-            self.handler.writer.write(pubrel.pack())
-            await self.handler.writer.drain()
-            self.logger.info(f"Sent PUBREL for packet_id={packet_id}")
+        # Respond with PUBREL
+        self.handler.send(PUBREL_PREFIX + U16.pack(packet_id))
+        self.logger.debug("Sent PUBREL for packet_id=%s", packet_id)
 
 class PubRelCommand(Command):
     async def execute(self):
         pubrel_msg: PubRelMessage = self.message
-        broker: Broker = self.handler.broker
 
-        async with broker.lock:
-            packet_id = pubrel_msg.packet_id
-            self.logger.info(f"PUBREL: packet_id={packet_id}")
+        packet_id = pubrel_msg.packet_id
+        self.logger.debug("PUBREL: packet_id=%s", packet_id)
 
-            # Respond with PUBCOMP
-            pubcomp = PubCompMessage(
-                header=Header(MessageType.PUBCOMP),
-                packet_id=packet_id
-            )
-            self.handler.writer.write(pubcomp.pack())
-            await self.handler.writer.drain()
-            self.logger.info(f"Sent PUBCOMP for packet_id={packet_id}")
+        # Respond with PUBCOMP
+        self.handler.send(PUBCOMP_PREFIX + U16.pack(packet_id))
+        self.logger.debug("Sent PUBCOMP for packet_id=%s", packet_id)
 
 class PingReqCommand(Command):
     async def execute(self):
-        broker: Broker = self.handler.broker
-
-        async with broker.lock:
-            self.logger.info("PINGREQ received")
+        self.logger.debug("PINGREQ received")
 
-            # Respond with PINGRESP
-            pingresp = PingRespMessage(
-                header=Header(MessageType.PINGRESP)
-            )
-            self.handler.writer.write(pingresp.pack())
-            await self.handler.writer.drain()
-            self.logger.info("Sent PINGRESP")
+        # Respond with PINGRESP
+        self.handler.send(PINGRESP_BYTES)
+        self.logger.debug("Sent PINGRESP")
 
 class DisconnectCommand(Command):
     async def execute(self):
-        broker: Broker = self.handler.broker
-
-        async with broker.lock:
-            self.logger.info(f"DISCONNECT from client_id={self.handler.client_id}")
-            self.handler.writer.close()
-            await self.handler.writer.wait_closed()
+        # Only closes this client's own socket; registry cleanup happens in the handler
+        self.logger.info("DISCONNECT from client_id=%s", self.handler.client_id)
+        # Replies to packets earlier in the same batch still go out before the close
+        self.handler.flush()
+        self.handler.writer.close()
+        await self.handler.writer.wait_closed()
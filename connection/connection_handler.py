@@ -1,7 +1,9 @@
 # server/connection_handler.py
 
 import asyncio
+import contextlib
 import logging
+from typing import Dict, List
 from messages.constants import MessageType
 
 from connection.broker import Broker
@@ -18,6 +20,23 @@ from connection.commands import (
 
 from messages import Message
 
+# Bytes requested from the socket per read; every complete packet in a read is handled as one batch
+READ_CHUNK_SIZE = 64 * 1024
+# Packets dispatched between drains when one read carries a long pipelined burst
+MAX_BATCH = 500
+
+# Packet type -> Command class handling it
+COMMAND_TABLE = {
+    MessageType.CONNECT: ConnectCommand,
+    MessageType.SUBSCRIBE: SubscribeCommand,
+    MessageType.UNSUBSCRIBE: UnsubscribeCommand,
+    MessageType.PUBLISH: PublishCommand,
+    MessageType.PUBREC: PubRecCommand,
+    MessageType.PUBREL: PubRelCommand,
+    MessageType.PINGREQ: PingReqCommand,
+    MessageType.DISCONNECT: DisconnectCommand,
+}
+
 class MQTTConnectionHandler:
     def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, broker: Broker):
         self.reader = reader
@@ -29,72 +48,162 @@ class MQTTConnectionHandler:
         self.client_id = None
         self.username = None
         self.clean_session = True
+        # Same lock PUBLISH fan-out uses for this writer, registered up front so drains never overlap
+        self.write_lock = broker.writer_lock(writer)
+        # Replies to this client, coalesced and written once per batch by flush()
+        self._tx_buf = bytearray()
+        # Frames PUBLISH fan-out queued for other clients this batch, one list per subscriber
+        self._forwarded: Dict[asyncio.StreamWriter, List[bytes]] = {}
+        # Subscribers written since the last drain()
+        self._forwarded_to: List[asyncio.StreamWriter] = []
+
+    def send(self, data: bytes):
+        """
+        Queue a reply to this client; it goes out with the next flush().
+        """
+        self._tx_buf += data
+
+    def forward(self, subscriber: asyncio.StreamWriter, data: bytes):
+        """
+        Queue a frame for another client; it goes out with the next flush().
+        """
+        frames = self._forwarded.get(subscriber)
+        if frames is None:
+            self._forwarded[subscriber] = [data]
+        else:
+            frames.append(data)
+
+    def flush(self):
+        """
+        Hand every queued reply to the transport as a single write,
+        then everything forwarded to each subscriber as one writelines().
+        """
+        if self._tx_buf:
+            self.writer.write(bytes(self._tx_buf))
+            self._tx_buf.clear()
+        if self._forwarded:
+            self._write_forwarded()
+
+    def _write_forwarded(self):
+        forwarded, self._forwarded = self._forwarded, {}
+        for subscriber, frames in forwarded.items():
+            # The subscriber may have gone away since its frames were queued
+            if subscriber.is_closing():
+                continue
+            try:
+                subscriber.writelines(frames)
+                self._forwarded_to.append(subscriber)
+            except Exception as e:
+                self.logger.error("Error forwarding PUBLISH to subscriber: %s", e)
+
+    async def drain(self):
+        """
+        Apply back-pressure after flush(): wait on every subscriber written to, then on this client.
+        """
+        if self._forwarded_to:
+            written, self._forwarded_to = self._forwarded_to, []
+            results = await asyncio.gather(*(self._drain_subscriber(w) for w in written), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    self.logger.error("Error forwarding PUBLISH to subscriber: %s", result)
+        async with self.write_lock:
+            await self.writer.drain()
+
+    async def _drain_subscriber(self, subscriber: asyncio.StreamWriter):
+        # Only one coroutine may wait on a writer's drain at a time
+        async with self.broker.writer_lock(subscriber):
+            await subscriber.drain()
 
     async def dispatch_command(self, message: Message):
         msg_type = message.header.message_type
 
-        command = None
-
-        if msg_type == MessageType.CONNECT:
-            command = ConnectCommand(self, message)
-        elif msg_type == MessageType.SUBSCRIBE:
-            command = SubscribeCommand(self, message)
-        elif msg_type == MessageType.UNSUBSCRIBE:
-            command = UnsubscribeCommand(self, message)
-        elif msg_type == MessageType.PUBLISH:
-            command = PublishCommand(self, message)
-        elif msg_type == MessageType.PUBREC:
-            command = PubRecCommand(self, message)
-        elif msg_type == MessageType.PUBREL:
-            command = PubRelCommand(self, message)
-        elif msg_type == MessageType.PINGREQ:
-            command = PingReqCommand(self, message)
-        elif msg_type == MessageType.DISCONNECT:
-            command = DisconnectCommand(self, message)
-        else:
-            self.logger.warning(f"Unknown message type: {msg_type}")
+        command_class = COMMAND_TABLE.get(msg_type)
+        if command_class is None:
+            self.logger.warning("Unknown message type: %s", msg_type)
             return
 
-        if command:
+        command = command_class.acquire(self, message)
+        try:
             await command.execute()
+        finally:
+            command.release()
 
     async def run(self):
+        # Holds only the tail of a packet split across reads
+        buffer = bytearray()
         while True:
             try:
-                message: Message = await Message.from_reader(self.reader)
-                await self.dispatch_command(message)
-            except asyncio.IncompleteReadError:
-                self.logger.info("Client disconnected unexpectedly.")
-                break
+                chunk = await self.reader.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    self.logger.info("Client disconnected unexpectedly.")
+                    break
+                # Usually nothing is pending and the chunk is parsed in place, without copying it
+                if buffer:
+                    buffer += chunk
+                    data = buffer
+                else:
+                    data = chunk
+
+                # Dispatch every packet that is already complete before going back to the event loop
+                offset = 0
+                batched = 0
+                while True:
+                    parsed = Message.from_buffer(data, offset)
+                    if parsed is None:
+                        break
+                    message, offset = parsed
+                    await self.dispatch_command(message)
+                    if self.writer.is_closing():
+                        break
+                    batched += 1
+                    if batched == MAX_BATCH:
+                        # Keep replies to a long burst from piling up unbounded in the transport
+                        batched = 0
+                        self.flush()
+                        await self.drain()
+                if data is buffer:
+                    del buffer[:offset]
+                elif offset < len(chunk):
+                    buffer += memoryview(chunk)[offset:]
+                if self.writer.is_closing():
+                    break
+
+                # Commands queue their replies; write them in one go and apply back-pressure once per batch
+                self.flush()
+                await self.drain()
             except Exception as e:
-                self.logger.error(f"Error handling message: {e}")
+                self.logger.error("Error handling message: %s", e)
                 break
 
+        # Frames already accepted for other clients still go out, even if this connection failed mid-batch
+        if self._forwarded:
+            self._write_forwarded()
+
         # Cleanup after disconnection
-        async with self.broker.lock:
-            if self.client_id:
+        async with self.broker.sessions_lock, self.broker.subs_lock:
+            # A newer connection may have taken over this client_id; its state is not ours to clean up
+            if self.client_id and self.broker.connected_clients.get(self.client_id) is self.writer:
                 if not self.clean_session:
                     # Persist session: subscriptions already handled during SUBSCRIBE
-                    self.logger.info(f"Persisted session for client_id={self.client_id}")
+                    session = self.broker.sessions.get(self.client_id)
+                    if session:
+                        self.broker.mark_offline(self.client_id, session)
+                    self.logger.info("Persisted session for client_id=%s", self.client_id)
                 else:
                     # Clean session: remove session data
-                    if self.client_id in self.broker.sessions:
-                        del self.broker.sessions[self.client_id]
-                        self.logger.info(f"Removed session for client_id={self.client_id}")
+                    if self.broker.sessions.pop(self.client_id, None) is not None:
+                        self.logger.info("Removed session for client_id=%s", self.client_id)
+                del self.broker.connected_clients[self.client_id]
 
             # Remove writer from subscription registry
-            if self.writer in self.broker.client_subscriptions:
-                for topic in self.broker.client_subscriptions[self.writer]:
-                    self.broker.subscriptions[topic].discard(self.writer)
-                    self.logger.info(f"Removed from topic '{topic}' subscriptions")
-                del self.broker.client_subscriptions[self.writer]
-
-            # Remove client from connected clients
-            if self.client_id in self.broker.connected_clients:
-                del self.broker.connected_clients[self.client_id]
-            if self.writer in self.broker.writer_to_client_id:
-                del self.broker.writer_to_client_id[self.writer]
+            topics = self.broker.client_subscriptions.pop(self.writer, None)
+            if topics:
+                for topic in topics:
+                    self.broker.subscriptions.discard(topic, self.writer)
+                    self.logger.info("Removed from topic '%s' subscriptions", topic)
 
-            self.writer.close()
+        # Closed outside the locks: a slow peer must not hold up other clients' CONNECT/SUBSCRIBE
+        self.writer.close()
+        with contextlib.suppress(ConnectionError):
             await self.writer.wait_closed()
-            self.logger.info(f"Connection with {self.client_id} closed.")
+        self.logger.info("Connection with %s closed.", self.client_id)
@@ -2,12 +2,25 @@
 
 import asyncio
 import logging
+import logging.handlers
+import queue
+import socket
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from connection.connection_handler import MQTTConnectionHandler
 from utils.singleton import Singleton
 
 from connection.broker import Broker
 
+SOCKET_SEND_BUFFER_SIZE = 1 << 20
+# Transport buffer watermarks: drain() blocks above the high mark and resumes below the low one
+WRITE_BUFFER_HIGH_WATER = 256 * 1024
+WRITE_BUFFER_LOW_WATER = 64 * 1024
+
 class Server(metaclass=Singleton):
     def __init__(self, host='127.0.0.1', port=1884, authentication=False):
         self.host = host
@@ -17,7 +30,24 @@ class Server(metaclass=Singleton):
         self.server = None
         self.logger = logging.getLogger("Server")
 
+    @staticmethod
+    def _tune_socket(writer: asyncio.StreamWriter):
+        """
+        Disable Nagle so acks and PINGRESP leave immediately; batching is done by the
+        connection handler's per-batch flush instead. A larger send buffer absorbs fan-out bursts,
+        and raised transport watermarks let a whole batch sit in the transport before drain() waits.
+        """
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH_WATER, low=WRITE_BUFFER_LOW_WATER)
+        sock = writer.get_extra_info('socket')
+        if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SEND_BUFFER_SIZE)
+        if hasattr(socket, 'TCP_QUICKACK'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tune_socket(writer)
         handler = MQTTConnectionHandler(reader, writer, self.broker)
         await handler.run()
 
@@ -30,18 +60,45 @@ class Server(metaclass=Singleton):
         addr = self.server.sockets[0].getsockname()
         self.logger.info(f"Server listening on {addr}. Authentication: {self.authentication}")
 
-        async with self.server:
-            await self.server.serve_forever()
+        # Persist user-store edits made before the server started, and any still pending at shutdown
+        self.broker.flush_user_data()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.broker.flush_user_data()
+
+    @staticmethod
+    def _queue_log_handlers() -> logging.handlers.QueueListener:
+        """
+        Put the root logger's handlers behind a queue: the event loop only enqueues records,
+        and the listener's thread writes them out.
+        """
+        root = logging.getLogger()
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        listener.start()
+        return listener
 
     def run(self):
         # Configure logging for the server if not already configured
+        listener = None
         if not logging.getLogger().hasHandlers():
             logging.basicConfig(
                 level=logging.INFO,
                 format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
             )
+            listener = self._queue_log_handlers()
+        # uvloop's libuv-based transports make each write and drain cheaper; stock asyncio otherwise
+        if uvloop is not None:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
         try:
             asyncio.run(self.start_server())
         except KeyboardInterrupt:
             self.logger.info("Server shut down via KeyboardInterrupt.")
+        finally:
+            # Writes out whatever is still queued
+            if listener is not None:
+                listener.stop()
@@ -0,0 +1,118 @@
+# connection/topic_trie.py
+
+from typing import AbstractSet, Dict, FrozenSet, Hashable, Set
+
+SINGLE_LEVEL_WILDCARD = '+'
+MULTI_LEVEL_WILDCARD = '#'
+
+
+class TopicNode:
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        self.children: Dict[str, 'TopicNode'] = {}
+        self.subscribers: Set[Hashable] = set()
+
+
+class TopicTrie:
+    """
+    Subscription index keyed on '/'-separated topic levels.
+    '+' and '#' are stored as ordinary children and honoured by match(),
+    so a PUBLISH costs O(topic depth) instead of O(number of subscriptions).
+    Filters without wildcards never need a level walk and live in a flat dict instead.
+    Their subscriber sets are immutable snapshots, rebuilt on (rare) subscribe/unsubscribe,
+    so a PUBLISH that only hits an exact filter can iterate them without copying.
+    """
+
+    def __init__(self):
+        self.root = TopicNode()
+        self.exact: Dict[str, FrozenSet[Hashable]] = {}
+
+    def __bool__(self) -> bool:
+        # Empty nodes are pruned on discard, so no children means no subscribers
+        return bool(self.exact) or bool(self.root.children)
+
+    @staticmethod
+    def _has_wildcard(topic_filter: str) -> bool:
+        return SINGLE_LEVEL_WILDCARD in topic_filter or MULTI_LEVEL_WILDCARD in topic_filter
+
+    def add(self, topic_filter: str, subscriber: Hashable):
+        if not self._has_wildcard(topic_filter):
+            self.exact[topic_filter] = self.exact.get(topic_filter, frozenset()) | {subscriber}
+            return
+
+        node = self.root
+        for level in topic_filter.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = TopicNode()
+            node = child
+        node.subscribers.add(subscriber)
+
+    def discard(self, topic_filter: str, subscriber: Hashable):
+        if not self._has_wildcard(topic_filter):
+            subscribers = self.exact.get(topic_filter)
+            if subscribers is not None and subscriber in subscribers:
+                subscribers = subscribers - {subscriber}
+                if subscribers:
+                    self.exact[topic_filter] = subscribers
+                else:
+                    del self.exact[topic_filter]
+            return
+
+        path = [self.root]
+        levels = topic_filter.split('/')
+        for level in levels:
+            child = path[-1].children.get(level)
+            if child is None:
+                return
+            path.append(child)
+        path[-1].subscribers.discard(subscriber)
+
+        # Prune nodes that no longer lead to any subscriber
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.subscribers or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+    def match(self, topic: str) -> AbstractSet[Hashable]:
+        """
+        Return every subscriber whose filter matches the concrete topic name.
+        Topics starting with '$' are not matched by a leading wildcard (MQTT 3.1.1, 4.7.2).
+        The result may be a shared snapshot and must not be mutated.
+        """
+        exact = self.exact.get(topic, frozenset())
+        if not self.root.children:
+            return exact
+        matched: Set[Hashable] = set(exact)
+
+        levels = topic.split('/')
+        nodes = [self.root]
+        for depth, level in enumerate(levels):
+            wildcards_allowed = depth > 0 or not level.startswith('$')
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if wildcards_allowed:
+                    multi = children.get(MULTI_LEVEL_WILDCARD)
+                    if multi is not None:
+                        matched |= multi.subscribers
+                    single = children.get(SINGLE_LEVEL_WILDCARD)
+                    if single is not None:
+                        next_nodes.append(single)
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                return matched
+
+        for node in nodes:
+            matched |= node.subscribers
+            # 'a/#' also matches the parent level 'a'
+            multi = node.children.get(MULTI_LEVEL_WILDCARD)
+            if multi is not None:
+                matched |= multi.subscribers
+        return matched
+
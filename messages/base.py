@@ -1,11 +1,10 @@
 import asyncio
 from abc import ABC, abstractmethod
 from io import BytesIO
-
-import bitstruct
+from typing import ClassVar, Optional, Tuple
 
 from .constants import MessageType
-from .utils import read_remaining_length, pack_remaining_length
+from .utils import Cursor, read_remaining_length, pack_remaining_length
 from .header import Header
 
 
@@ -13,14 +12,22 @@ class Message(ABC):
     """
     Abstract base class for all MQTT messages.
     Each subclass must implement from_data() and pack() to parse/emit bytes.
+    Subclasses are slotted dataclasses, so instances carry no per-object __dict__.
     """
+    __slots__ = ()
+
+    # Set by subclasses that can re-send a received packet unchanged; from_buffer() then
+    # passes them the packet's original bytes through keep_frame()
+    KEEP_FRAME: ClassVar[bool] = False
+
     header: Header
 
     @classmethod
     @abstractmethod
     def from_data(cls, header: Header, data: BytesIO) -> 'Message':
         """
-        Parse a message's variable header & payload from a BytesIO, given an already-decoded fixed header.
+        Parse a message's variable header & payload from a BytesIO (or a Cursor, which reads the same way),
+        given an already-decoded fixed header.
         """
         pass
 
@@ -31,6 +38,18 @@ class Message(ABC):
         """
         pass
 
+    def keep_frame(self, frame: bytes):
+        """
+        Called by from_buffer() with the packet as received, for classes with KEEP_FRAME set.
+        """
+
+    def pack_iov(self) -> list:
+        """
+        Return the packet as a list of bytes chunks for writer.writelines().
+        Subclasses with large payloads override this to avoid concatenating the payload.
+        """
+        return [self.pack()]
+
     @classmethod
     async def from_reader(cls, reader: asyncio.StreamReader) -> 'Message':
         """
@@ -40,44 +59,100 @@ class Message(ABC):
         3. Read that many bytes -> parse the message
         4. Dispatch to the right subclass based on message type.
         """
-        first_byte = await reader.readexactly(1)
-        if not first_byte:
-            raise ConnectionError("Stream ended unexpectedly (no first byte).")
+        # Every packet is at least two bytes: the first byte and one byte of 'Remaining Length'
+        head = await reader.readexactly(2)
 
         # Parse the fixed header's control bits:
-        header = Header.from_bytes(first_byte)
+        header = Header.from_bytes(head)
 
-        # Read 'Remaining Length'
-        remaining_len = await read_remaining_length(reader)
+        # Read 'Remaining Length'; values below 128 fit in the byte we already have
+        remaining_len = head[1]
+        if remaining_len & 128:
+            remaining_len = await read_remaining_length(reader, remaining_len)
         if remaining_len > 0:
             packet_body = await reader.readexactly(remaining_len)
         else:
             packet_body = b''
 
-        # Turn the body into a BytesIO for convenient parsing
-        data_stream = BytesIO(packet_body)
+        # Wrap the body in a cursor for convenient parsing
+        data_stream = Cursor(packet_body)
 
         # Dynamically get the correct message class from the type
-        msg_class = MessageFactory.get_message_class(header.message_type)
+        msg_class = MessageFactory.by_type[header.message_type]
         if msg_class is None:
             raise NotImplementedError(f"Message type {header.message_type} not supported.")
 
         return msg_class.from_data(header, data_stream)
 
+    @classmethod
+    def from_buffer(cls, buffer: bytes, start: int = 0) -> Optional[Tuple['Message', int]]:
+        """
+        Parse one MQTT packet from already-received bytes, beginning at `start`.
+        Returns (message, end offset), or None if the packet is not complete yet.
+        """
+        end = len(buffer)
+        if end - start < 2:
+            return None
+
+        header = Header.from_bytes(buffer[start:start + 1])
+
+        # Decode 'Remaining Length' in place; nearly every packet fits it in one byte
+        remaining_len = buffer[start + 1]
+        pos = start + 2
+        if remaining_len & 128:
+            remaining_len &= 127
+            # Continuation bytes: at most three more, 7 bits each
+            for shift in (7, 14, 21):
+                if pos >= end:
+                    return None
+                encoded_byte = buffer[pos]
+                pos += 1
+                remaining_len |= (encoded_byte & 127) << shift
+                if not encoded_byte & 128:
+                    break
+            else:
+                raise ValueError("Malformed remaining length.")
+
+        body_end = pos + remaining_len
+        if body_end > end:
+            return None
+
+        msg_class = MessageFactory.by_type[header.message_type]
+        if msg_class is None:
+            raise NotImplementedError(f"Message type {header.message_type} not supported.")
+
+        # Parse straight out of the caller's buffer instead of slicing the body into a BytesIO
+        data_stream = Cursor(buffer, pos, body_end)
+        try:
+            message = msg_class.from_data(header, data_stream)
+        finally:
+            data_stream.release()
+
+        if msg_class.KEEP_FRAME:
+            # Slicing bytes already yields bytes (or the object itself for a whole-buffer packet)
+            if isinstance(buffer, bytes):
+                message.keep_frame(buffer[start:body_end])
+            else:
+                message.keep_frame(bytes(memoryview(buffer)[start:body_end]))
+        return message, body_end
+
 
 class MessageFactory:
     """
     Simple registry to map a MessageType to a concrete subclass of Message.
     """
     registry = {}
+    # Same mapping as a flat list indexed by the 4-bit packet type, for the per-packet lookup
+    by_type = [None] * 16
 
     @classmethod
     def register(cls, msg_type: MessageType):
         def decorator(message_class):
             cls.registry[msg_type] = message_class
+            cls.by_type[msg_type] = message_class
             return message_class
         return decorator
 
     @classmethod
     def get_message_class(cls, msg_type: MessageType):
-        return cls.registry.get(msg_type, None)
+        return cls.by_type[msg_type]
@@ -6,7 +6,8 @@ from .constants import MessageType
 from .header import Header
 from .utils import pack_remaining_length
 
-@dataclass
+@MessageFactory.register(MessageType.CONNACK)
+@dataclass(slots=True)
 class ConnAckMessage(Message):
     """
     CONNACK packet: variable header = 2 bytes
@@ -31,8 +32,3 @@ class ConnAckMessage(Message):
         variable = bytes([self.session_present & 0x01, self.return_code & 0xFF])
         remaining_length = len(variable)
         return fixed_header + pack_remaining_length(remaining_length) + variable
-
-
-@MessageFactory.register(MessageType.CONNACK)
-class _ConnAckMessageFactory(ConnAckMessage):
-    pass
@@ -1,11 +1,11 @@
+import struct
 from io import BytesIO
-import bitstruct
 from dataclasses import dataclass
 
 from .base import Message, MessageFactory
 from .constants import MessageType
 from .header import Header
-from .utils import pack_remaining_length, unpack_string, pack_string
+from .utils import new_packet_buffer, finish_packet, unpack_string, pack_string
 
 # CONNECT Flags layout (per MQTT 3.1.1) - one byte:
 # bit 7: usernameFlag
@@ -15,10 +15,14 @@ from .utils import pack_remaining_length, unpack_string, pack_string
 # bit 2: willFlag
 # bit 1: cleanSession
 # bit 0: reserved (must be 0)
-CONNECT_FLAGS = bitstruct.compile('u1u1u1u2u1u1u1')
+# Decoded and encoded with shifts and masks below.
 
+# Protocol Level, Connect Flags and Keep Alive sit back to back after the protocol name
+_CONNECT_FIXED = struct.Struct('>BBH')
 
-@dataclass
+
+@MessageFactory.register(MessageType.CONNECT)
+@dataclass(slots=True)
 class ConnectMessage(Message):
     """
     Represents a CONNECT packet with basic fields. Simplified, but enough to illustrate logic.
@@ -42,28 +46,22 @@ class ConnectMessage(Message):
         # 1) Protocol Name (string)
         protocol_name = unpack_string(data)
 
-        # 2) Protocol Level (1 byte)
-        protocol_level = data.read(1)
-        if len(protocol_level) < 1:
-            raise ValueError("Not enough bytes for protocol level.")
-        protocol_level = protocol_level[0]
+        # 2) Protocol Level (1 byte), 3) Connect Flags (1 byte), 4) Keep Alive (2 bytes) in one unpack
+        fixed = data.read(_CONNECT_FIXED.size)
+        if len(fixed) < _CONNECT_FIXED.size:
+            raise ValueError("Not enough bytes for protocol level, connect flags and keep alive.")
+        protocol_level, flags, keep_alive = _CONNECT_FIXED.unpack(fixed)
 
-        # 3) Connect Flags (1 byte)
-        raw_flags = data.read(1)
-        if len(raw_flags) < 1:
-            raise ValueError("Not enough bytes for connect flags.")
-        (username_flag, password_flag, will_retain,
-         will_qos, will_flag, clean_session, reserved) = CONNECT_FLAGS.unpack(raw_flags)
+        username_flag = (flags >> 7) & 1
+        password_flag = (flags >> 6) & 1
+        will_retain = (flags >> 5) & 1
+        will_qos = (flags >> 3) & 3
+        will_flag = (flags >> 2) & 1
+        clean_session = (flags >> 1) & 1
 
-        if reserved != 0:
+        if flags & 1:
             raise ValueError("Malformed CONNECT flags: reserved bit != 0")
 
-        # 4) Keep Alive (2 bytes)
-        ka_raw = data.read(2)
-        if len(ka_raw) < 2:
-            raise ValueError("Not enough bytes for keep alive.")
-        keep_alive = int.from_bytes(ka_raw, 'big')
-
         # 5) Client ID (MQTT spec requires at least one char if cleanSession=0)
         client_id = unpack_string(data)
 
@@ -96,23 +94,21 @@ class ConnectMessage(Message):
         )
 
     def pack(self) -> bytes:
-        # Construct variable header + payload:
-        variable = b""
+        # Construct variable header + payload in one growing buffer, headed by room for the fixed header:
+        variable = new_packet_buffer()
         variable += pack_string(self.protocol_name)
-        variable += bytes([self.protocol_level])
 
         # Re-pack the connect flags
-        flags_byte = CONNECT_FLAGS.pack(
-            self.username_flag,
-            self.password_flag,
-            self.will_retain,
-            self.will_qos,
-            self.will_flag,
-            self.clean_session,
-            0  # reserved bit
+        flags = (
+            ((self.username_flag & 1) << 7)
+            | ((self.password_flag & 1) << 6)
+            | ((self.will_retain & 1) << 5)
+            | ((self.will_qos & 3) << 3)
+            | ((self.will_flag & 1) << 2)
+            | ((self.clean_session & 1) << 1)
+            # bit 0 (reserved) stays 0
         )
-        variable += flags_byte
-        variable += self.keep_alive.to_bytes(2, 'big')
+        variable += _CONNECT_FIXED.pack(self.protocol_level, flags, self.keep_alive)
 
         # Client ID
         variable += pack_string(self.client_id)
@@ -125,18 +121,5 @@ class ConnectMessage(Message):
         if self.password_flag == 1:
             variable += pack_string(self.password)
 
-        # Fixed header + Remaining length + variable+payload
-        fixed_header = self.header.pack()
-        remaining_length = len(variable)
-        return fixed_header + \
-               pack_remaining_length(remaining_length) + \
-               variable
-
-
-@MessageFactory.register(MessageType.CONNECT)
-class _ConnectMessageFactory(ConnectMessage):
-    """
-    This wrapper ensures the ConnectMessage is registered in the factory.
-    In practice, you could just decorate ConnectMessage directly.
-    """
-    pass
+        # Fixed header + Remaining length are filled in ahead of variable+payload
+        return finish_packet(self.header.pack(), variable)
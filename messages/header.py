@@ -1,23 +1,26 @@
-import bitstruct
 from dataclasses import dataclass
 
 from .constants import MessageType
 
-# We'll compile a single byte that contains:
-#   - 4 bits for message type
-#   - 1 bit for DUP
-#   - 2 bits for QoS
-#   - 1 bit for RETAIN
+# The first byte of the fixed header contains:
+#   - 4 bits for message type  (bits 7-4)
+#   - 1 bit for DUP            (bit 3)
+#   - 2 bits for QoS           (bits 2-1)
+#   - 1 bit for RETAIN         (bit 0)
 #
-# bitstruct.compile('u4u1u2u1') maps:
-#   - first 4 bits  -> messageType
-#   - next 1 bit    -> DUP
-#   - next 2 bits   -> QoS
-#   - next 1 bit    -> RETAIN
-FIXED_HEADER = bitstruct.compile('u4u1u2u1')
-
-
-@dataclass
+# A single byte is cheaper to take apart with shifts and masks than through a bit-field codec.
+# It only has 256 possible values, so each one is decoded once up front
+# and per-packet header parsing becomes a tuple lookup.
+_MESSAGE_TYPES = {message_type.value: message_type for message_type in MessageType}
+_DECODED_FIRST_BYTE = [
+    (_MESSAGE_TYPES[byte >> 4], (byte >> 3) & 1, (byte >> 1) & 3, byte & 1)
+    if (byte >> 4) in _MESSAGE_TYPES else None
+    for byte in range(256)
+]
+_FIRST_BYTES = [bytes((byte,)) for byte in range(256)]
+
+
+@dataclass(slots=True)
 class Header:
     message_type: MessageType
     dup: int = 0
@@ -28,33 +31,24 @@ class Header:
     def from_bytes(cls, data: bytes) -> 'Header':
         """
         data is the first byte (8 bits) of the fixed header.
-        We'll unpack it using the bitstruct pattern above.
+        The bits were already unpacked into _DECODED_FIRST_BYTE at import time.
         """
         if len(data) < 1:
             raise ValueError("Not enough bytes to parse header.")
 
-        (message_type_raw,
-         dup,
-         qos,
-         retain) = FIXED_HEADER.unpack(bytes([data[0]]))
-
-        message_type_enum = MessageType(message_type_raw)
-        return cls(
-            message_type=message_type_enum,
-            dup=dup,
-            qos=qos,
-            retain=retain
-        )
+        decoded = _DECODED_FIRST_BYTE[data[0]]
+        if decoded is None:
+            raise ValueError(f"{data[0] >> 4} is not a valid MessageType")
+        return cls(*decoded)
 
     def pack(self) -> bytes:
         """
         Packs the first byte of the fixed header according to
         message_type, dup, qos, retain bits.
         """
-        packed_byte = FIXED_HEADER.pack(
-            self.message_type.value,
-            self.dup,
-            self.qos,
-            self.retain
-        )
-        return packed_byte
+        return _FIRST_BYTES[
+            ((self.message_type & 0x0F) << 4)
+            | ((self.dup & 1) << 3)
+            | ((self.qos & 3) << 1)
+            | (self.retain & 1)
+        ]
@@ -0,0 +1,30 @@
+from io import BytesIO
+from dataclasses import dataclass
+
+from .base import Message
+from .header import Header
+from .utils import U16, pack_remaining_length
+
+# Every packet-id-only packet has a Remaining Length of exactly 2
+_REMAINING_LENGTH = pack_remaining_length(2)
+
+
+@dataclass(slots=True)
+class PacketIdMessage(Message):
+    """
+    Shared base for packets whose only content is a 2-byte Packet Identifier
+    (PUBACK, PUBREC, PUBREL, PUBCOMP, UNSUBACK). Subclasses just add a docstring
+    and their factory registration.
+    """
+    header: Header
+    packet_id: int
+
+    @classmethod
+    def from_data(cls, header: Header, data: BytesIO) -> 'PacketIdMessage':
+        pid_bytes = data.read(2)
+        if len(pid_bytes) < 2:
+            raise ValueError(f"Not enough bytes for {header.message_type.name} packet_id.")
+        return cls(header, U16.unpack(pid_bytes)[0])
+
+    def pack(self) -> bytes:
+        return self.header.pack() + _REMAINING_LENGTH + U16.pack(self.packet_id)
@@ -7,7 +7,11 @@ from .header import Header
 from .utils import pack_remaining_length
 
 
-@dataclass
+_PACKED = Header(MessageType.PINGREQ).pack() + pack_remaining_length(0)
+
+
+@MessageFactory.register(MessageType.PINGREQ)
+@dataclass(slots=True)
 class PingReqMessage(Message):
     """
     PINGREQ has no variable header or payload (MQTT 3.1.1).
@@ -20,11 +24,5 @@ class PingReqMessage(Message):
         return cls(header)
 
     def pack(self) -> bytes:
-        # No variable header/payload
-        fixed_header = self.header.pack()
-        return fixed_header + pack_remaining_length(0)
-
-
-@MessageFactory.register(MessageType.PINGREQ)
-class _PingReqMessageFactory(PingReqMessage):
-    pass
+        # No variable header/payload, and all flag bits are reserved as 0: always the same two bytes
+        return _PACKED
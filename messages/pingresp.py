@@ -7,7 +7,11 @@ from .header import Header
 from .utils import pack_remaining_length
 
 
-@dataclass
+_PACKED = Header(MessageType.PINGRESP).pack() + pack_remaining_length(0)
+
+
+@MessageFactory.register(MessageType.PINGRESP)
+@dataclass(slots=True)
 class PingRespMessage(Message):
     """
     PINGRESP has no variable header or payload (MQTT 3.1.1).
@@ -19,10 +23,5 @@ class PingRespMessage(Message):
         return cls(header)
 
     def pack(self) -> bytes:
-        fixed_header = self.header.pack()
-        return fixed_header + pack_remaining_length(0)
-
-
-@MessageFactory.register(MessageType.PINGRESP)
-class _PingRespMessageFactory(PingRespMessage):
-    pass
+        # No variable header/payload, and all flag bits are reserved as 0: always the same two bytes
+        return _PACKED
@@ -1,12 +1,14 @@
 from io import BytesIO
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import ClassVar, Optional, Tuple
 
 from .base import Message, MessageFactory
 from .constants import MessageType
 from .header import Header
-from .utils import unpack_string, pack_string, pack_remaining_length
+from .utils import U16, unpack_string_wire, pack_string, pack_remaining_length
 
-@dataclass
+@MessageFactory.register(MessageType.PUBLISH)
+@dataclass(slots=True)
 class PublishMessage(Message):
     """
     PUBLISH packet. Variable header includes:
@@ -18,11 +20,17 @@ class PublishMessage(Message):
     topic: str
     packet_id: int
     payload: bytes
+    # (topic, its length-prefixed wire bytes) as parsed; pack_iov() reuses them while `topic` is that same object
+    _wire_topic: Optional[Tuple[str, bytes]] = field(default=None, init=False, repr=False, compare=False)
+    # (topic, payload, packet_id, whole packet) as received; pack() returns the packet while those still match
+    _frame: Optional[Tuple[str, bytes, int, bytes]] = field(default=None, init=False, repr=False, compare=False)
+
+    KEEP_FRAME: ClassVar[bool] = True
 
     @classmethod
     def from_data(cls, header: Header, data: BytesIO) -> 'PublishMessage':
         # 1) Topic Name
-        topic = unpack_string(data)
+        topic, wire_topic = unpack_string_wire(data)
         packet_id = 0
 
         # 2) If QoS > 0, packet identifier is next 2 bytes
@@ -30,24 +38,38 @@ class PublishMessage(Message):
             pid_bytes = data.read(2)
             if len(pid_bytes) < 2:
                 raise ValueError("Not enough bytes for packet identifier.")
-            packet_id = int.from_bytes(pid_bytes, 'big')
+            packet_id = U16.unpack(pid_bytes)[0]
 
         # 3) Payload is whatever remains
         payload = data.read()
-        return cls(header, topic, packet_id, payload)
+        message = cls(header, topic, packet_id, payload)
+        message._wire_topic = (topic, wire_topic)
+        return message
 
-    def pack(self) -> bytes:
-        variable = b""
-        variable += pack_string(self.topic)
-        if self.header.qos > 0:
-            variable += self.packet_id.to_bytes(2, 'big')
-        variable += self.payload
+    def pack_iov(self) -> list:
+        # Header fields are small; the payload is passed through without being copied
+        # A forwarded PUBLISH writes its topic back exactly as received, skipping the UTF-8 encode
+        wire_topic = self._wire_topic
+        if wire_topic is not None and wire_topic[0] is self.topic:
+            topic = wire_topic[1]
+        else:
+            topic = pack_string(self.topic)
+        packet_id = U16.pack(self.packet_id) if self.header.qos > 0 else b""
 
-        fixed_header = self.header.pack()
-        remaining_length = len(variable)
-        return fixed_header + pack_remaining_length(remaining_length) + variable
+        remaining_length = len(topic) + len(packet_id) + len(self.payload)
+        head = b"".join((self.header.pack(), pack_remaining_length(remaining_length), topic, packet_id))
+        return [head, self.payload]
 
+    def keep_frame(self, frame: bytes):
+        self._frame = (self.topic, self.payload, self.packet_id, frame)
 
-@MessageFactory.register(MessageType.PUBLISH)
-class _PublishMessageFactory(PublishMessage):
-    pass
+    def pack(self) -> bytes:
+        # A PUBLISH being forwarded unchanged goes out as the very bytes that came in
+        kept = self._frame
+        if kept is not None:
+            topic, payload, packet_id, frame = kept
+            if (topic is self.topic and payload is self.payload and packet_id == self.packet_id
+                    and frame[0] == self.header.pack()[0]):
+                return frame
+        # A single join copies the payload once
+        return b"".join(self.pack_iov())
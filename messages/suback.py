@@ -4,10 +4,11 @@ from dataclasses import dataclass
 from .base import Message, MessageFactory
 from .constants import MessageType
 from .header import Header
-from .utils import pack_remaining_length
+from .utils import U16, new_packet_buffer, finish_packet
 
 
-@dataclass
+@MessageFactory.register(MessageType.SUBACK)
+@dataclass(slots=True)
 class SubAckMessage(Message):
     """
     SUBACK packet. Variable header:
@@ -24,21 +25,14 @@ class SubAckMessage(Message):
         pid_bytes = data.read(2)
         if len(pid_bytes) < 2:
             raise ValueError("Not enough bytes for SUBACK packet ID.")
-        packet_id = int.from_bytes(pid_bytes, 'big')
+        packet_id = U16.unpack(pid_bytes)[0]
 
         return_codes = list(data.read())
         return cls(header, packet_id, return_codes)
 
     def pack(self) -> bytes:
-        variable = b""
-        variable += self.packet_id.to_bytes(2, 'big')
-        variable += bytes(self.return_codes)
-
-        fixed_header = self.header.pack()
-        remaining_length = len(variable)
-        return fixed_header + pack_remaining_length(remaining_length) + variable
+        variable = new_packet_buffer()
+        variable += U16.pack(self.packet_id)
+        variable.extend(self.return_codes)
 
-
-@MessageFactory.register(MessageType.SUBACK)
-class _SubAckMessageFactory(SubAckMessage):
-    pass
+        return finish_packet(self.header.pack(), variable)
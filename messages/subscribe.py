@@ -1,13 +1,14 @@
 from io import BytesIO
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from .base import Message, MessageFactory
 from .constants import MessageType
 from .header import Header
-from .utils import unpack_string, pack_string, pack_remaining_length
+from .utils import U16, new_packet_buffer, finish_packet, unpack_string, pack_string
 
 
-@dataclass
+@MessageFactory.register(MessageType.SUBSCRIBE)
+@dataclass(slots=True)
 class SubscribeMessage(Message):
     """
     SUBSCRIBE packet. Variable header:
@@ -18,6 +19,13 @@ class SubscribeMessage(Message):
     header: Header
     packet_id: int
     subscriptions: list  # list of (topic, qos)
+    # Parallel views of `subscriptions`, so consumers can work on whole columns
+    topics: list = field(init=False, repr=False, compare=False)
+    qos: list = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.topics = [topic for topic, _ in self.subscriptions]
+        self.qos = [qos for _, qos in self.subscriptions]
 
     @classmethod
     def from_data(cls, header: Header, data: BytesIO) -> 'SubscribeMessage':
@@ -25,13 +33,13 @@ class SubscribeMessage(Message):
         pid_bytes = data.read(2)
         if len(pid_bytes) < 2:
             raise ValueError("Not enough bytes for SUBSCRIBE packet ID.")
-        packet_id = int.from_bytes(pid_bytes, 'big')
+        packet_id = U16.unpack(pid_bytes)[0]
 
         # 2) Then, parse topic + QoS pairs until no more data
+        # The body length is fixed, so look it up once rather than on every iteration
+        end = len(data.getbuffer())
         subscriptions = []
-        while True:
-            if data.tell() >= len(data.getbuffer()):
-                break
+        while data.tell() < end:
             topic = unpack_string(data)
             req_qos_bytes = data.read(1)
             if len(req_qos_bytes) < 1:
@@ -42,19 +50,12 @@ class SubscribeMessage(Message):
         return cls(header, packet_id, subscriptions)
 
     def pack(self) -> bytes:
-        variable = b""
         # Packet identifier
-        variable += self.packet_id.to_bytes(2, 'big')
+        variable = new_packet_buffer()
+        variable += U16.pack(self.packet_id)
 
         for topic, qos in self.subscriptions:
             variable += pack_string(topic)
-            variable += bytes([qos & 0x03])
-
-        fixed_header = self.header.pack()
-        remaining_length = len(variable)
-        return fixed_header + pack_remaining_length(remaining_length) + variable
+            variable.append(qos & 0x03)
 
-
-@MessageFactory.register(MessageType.SUBSCRIBE)
-class _SubscribeMessageFactory(SubscribeMessage):
-    pass
+        return finish_packet(self.header.pack(), variable)
@@ -1,36 +1,12 @@
-from io import BytesIO
-from dataclasses import dataclass
-
-from .base import Message, MessageFactory
+from .base import MessageFactory
 from .constants import MessageType
-from .header import Header
-from .utils import pack_remaining_length
+from .packet_id import PacketIdMessage
 
 
-@dataclass
-class UnsubAckMessage(Message):
+@MessageFactory.register(MessageType.UNSUBACK)
+class UnsubAckMessage(PacketIdMessage):
     """
     UNSUBACK packet: variable header = 2 bytes for the Packet Identifier.
     Payload: None in MQTT 3.1.1.
     """
-    header: Header
-    packet_id: int
-
-    @classmethod
-    def from_data(cls, header: Header, data: BytesIO) -> 'UnsubAckMessage':
-        pid_bytes = data.read(2)
-        if len(pid_bytes) < 2:
-            raise ValueError("Not enough bytes for UNSUBACK packet ID.")
-        packet_id = int.from_bytes(pid_bytes, 'big')
-        return cls(header, packet_id)
-
-    def pack(self) -> bytes:
-        variable = self.packet_id.to_bytes(2, 'big')
-        fixed_header = self.header.pack()
-        remaining_length = len(variable)
-        return fixed_header + pack_remaining_length(remaining_length) + variable
-
-
-@MessageFactory.register(MessageType.UNSUBACK)
-class _UnsubAckMessageFactory(UnsubAckMessage):
-    pass
+    __slots__ = ()
@@ -4,10 +4,11 @@ from dataclasses import dataclass
 from .base import Message, MessageFactory
 from .constants import MessageType
 from .header import Header
-from .utils import unpack_string, pack_string, pack_remaining_length
+from .utils import U16, new_packet_buffer, finish_packet, unpack_string, pack_string
 
 
-@dataclass
+@MessageFactory.register(MessageType.UNSUBSCRIBE)
+@dataclass(slots=True)
 class UnsubscribeMessage(Message):
     """
     UNSUBSCRIBE packet. Variable header:
@@ -24,28 +25,20 @@ class UnsubscribeMessage(Message):
         pid_bytes = data.read(2)
         if len(pid_bytes) < 2:
             raise ValueError("Not enough bytes for UNSUBSCRIBE packet ID.")
-        packet_id = int.from_bytes(pid_bytes, 'big')
+        packet_id = U16.unpack(pid_bytes)[0]
 
+        # The body length is fixed, so look it up once rather than on every iteration
+        end = len(data.getbuffer())
         topics = []
-        while True:
-            if data.tell() >= len(data.getbuffer()):
-                break
-            topic = unpack_string(data)
-            topics.append(topic)
+        while data.tell() < end:
+            topics.append(unpack_string(data))
 
         return cls(header, packet_id, topics)
 
     def pack(self) -> bytes:
-        variable = b""
-        variable += self.packet_id.to_bytes(2, 'big')
+        variable = new_packet_buffer()
+        variable += U16.pack(self.packet_id)
         for topic in self.topics:
             variable += pack_string(topic)
 
-        fixed_header = self.header.pack()
-        remaining_length = len(variable)
-        return fixed_header + pack_remaining_length(remaining_length) + variable
-
-
-@MessageFactory.register(MessageType.UNSUBSCRIBE)
-class _UnsubscribeMessageFactory(UnsubscribeMessage):
-    pass
+        return finish_packet(self.header.pack(), variable)
@@ -1,56 +1,163 @@
 import asyncio
-from typing import Literal
+import struct
+from functools import lru_cache
+from typing import Literal, Optional, Tuple
 from io import BytesIO
 
 BYTE_ORDER: Literal['little', 'big'] = 'big'
 
-async def read_remaining_length(reader: asyncio.StreamReader) -> int:
+# Big-endian unsigned 16-bit field (packet identifiers, keep alive)
+U16 = struct.Struct('>H')
+
+async def read_remaining_length(reader: asyncio.StreamReader, first_byte: Optional[int] = None) -> int:
     """
     Reads the 'Remaining Length' field of an MQTT packet.
     It's a variable-length scheme where each byte uses 7 bits of info + 1 continuation bit.
+    If the caller already consumed the first encoded byte, it is passed in as first_byte.
     """
-    multiplier = 1
-    value = 0
+    if first_byte is None:
+        first_byte = (await reader.readexactly(1))[0]
+    # Single-byte lengths (below 128) need no loop at all
+    if not first_byte & 128:
+        return first_byte
 
-    while True:
-        byte = await reader.readexactly(1)
-        encoded_byte = byte[0]
+    value = first_byte & 127
+    # The field is at most 4 bytes long, so at most three continuation bytes follow
+    for shift in (7, 14, 21):
+        encoded_byte = (await reader.readexactly(1))[0]
+        value |= (encoded_byte & 127) << shift
+        # If continuation bit not set, stop
+        if not encoded_byte & 128:
+            return value
+    raise ValueError("Malformed remaining length.")
 
-        value += (encoded_byte & 127) * multiplier
-        multiplier *= 128
 
-        # If continuation bit not set, stop
-        if (encoded_byte & 128) == 0:
-            break
+# Largest value a 4-byte Remaining Length can carry
+MAX_REMAINING_LENGTH = 268435455
 
-    return value
+# Lengths below 128 encode to a single byte, which covers most control packets
+_SINGLE_BYTE_LENGTHS = [bytes((length,)) for length in range(128)]
 
 
 def pack_remaining_length(length: int) -> bytes:
     """
     Encodes the 'Remaining Length' field using the same variable-length scheme.
     """
-    encoded = bytearray()
-    while True:
-        digit = length % 128
-        length //= 128
-        # if there are more digits to encode, set the top bit of this digit
-        if length > 0:
-            digit |= 128
-        encoded.append(digit)
-        if length == 0:
-            break
-    return bytes(encoded)
+    if length < 128:
+        return _SINGLE_BYTE_LENGTHS[length]
+    return _pack_long_remaining_length(length)
+
+
+@lru_cache(maxsize=4096)
+def _pack_long_remaining_length(length: int) -> bytes:
+    # Payload sizes repeat a lot (same sensor, same message shape), so longer encodings are memoized
+    # Unrolled per encoded size; every byte but the last has the continuation bit set
+    if length < 16384:
+        return bytes(((length & 127) | 128, length >> 7))
+    if length < 2097152:
+        return bytes(((length & 127) | 128, ((length >> 7) & 127) | 128, length >> 14))
+    if length < MAX_REMAINING_LENGTH + 1:
+        return bytes((
+            (length & 127) | 128, ((length >> 7) & 127) | 128, ((length >> 14) & 127) | 128, length >> 21
+        ))
+    raise ValueError(f"Remaining Length {length} exceeds the MQTT maximum of {MAX_REMAINING_LENGTH}.")
+
+
+# Fixed header byte plus the longest (4-byte) Remaining Length
+PACKET_HEAD_ROOM = 5
+
+
+def new_packet_buffer() -> bytearray:
+    """
+    Start an output buffer for finish_packet(): the body is appended after PACKET_HEAD_ROOM reserved bytes.
+    """
+    return bytearray(PACKET_HEAD_ROOM)
+
+
+def finish_packet(fixed_header: bytes, out: bytearray) -> bytes:
+    """
+    Write the fixed header and Remaining Length right in front of the body in `out`
+    and return the finished packet with one copy, whatever the body length turned out to be.
+    """
+    remaining_length = pack_remaining_length(len(out) - PACKET_HEAD_ROOM)
+    start = PACKET_HEAD_ROOM - 1 - len(remaining_length)
+    out[start:PACKET_HEAD_ROOM] = fixed_header + remaining_length
+    with memoryview(out) as view:
+        return bytes(view[start:])
+
+
+class Cursor:
+    """
+    Minimal read-only stand-in for BytesIO over one packet body inside a larger buffer.
+    Only read(), tell() and getbuffer() are provided - what the from_data parsers use -
+    plus read_string(), which unpack_string() uses to skip the intermediate bytes copies.
+    The body is never copied as a whole; each read() copies just the bytes it returns.
+    """
+    __slots__ = ('_buffer', '_view', '_start', '_pos', '_end')
+
+    def __init__(self, buffer, start: int = 0, end: Optional[int] = None):
+        # The buffer itself is kept for read_string(): slicing bytes/bytearray and decoding that
+        # is cheaper than decoding a memoryview slice, which goes through the generic codec lookup
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._start = self._pos = start
+        self._end = len(self._view) if end is None else end
+
+    def read(self, n: int = -1) -> bytes:
+        pos = self._pos
+        end = self._end if n < 0 else min(pos + n, self._end)
+        self._pos = end
+        return bytes(self._view[pos:end])
+
+    def tell(self) -> int:
+        return self._pos - self._start
+
+    def getbuffer(self) -> memoryview:
+        return self._view[self._start:self._end]
+
+    def read_string(self) -> str:
+        """
+        Same contract as unpack_string(), but reads the length and text straight from the buffer.
+        """
+        buffer, pos, end = self._buffer, self._pos, self._end
+        if end - pos < 2:
+            raise ValueError("Not enough bytes to unpack string length.")
+        start = pos + 2
+        stop = start + ((buffer[pos] << 8) | buffer[pos + 1])
+        if stop > end:
+            raise ValueError("Not enough bytes to read full string.")
+        self._pos = stop
+        try:
+            # The UTF-8 codec already has its own ASCII fast path; a separate isascii() pre-check only adds a pass
+            return buffer[start:stop].decode('utf-8')
+        except UnicodeDecodeError:
+            raise ValueError("Invalid UTF-8 string.")
+
+    def read_string_wire(self) -> Tuple[str, bytes]:
+        """
+        Like read_string(), but also returns the field exactly as it appeared on the wire
+        (length prefix included), so it can be written back out without re-encoding.
+        """
+        pos = self._pos
+        text = self.read_string()
+        return text, bytes(self._view[pos:self._pos])
+
+    def release(self):
+        """Drop the view so the underlying bytearray can be resized again."""
+        self._view.release()
+        self._buffer = None
 
 
 def unpack_string(data: BytesIO) -> str:
     """
     Reads a 2-byte length followed by that many bytes of UTF-8 text from the BytesIO object.
     """
+    if isinstance(data, Cursor):
+        return data.read_string()
     raw_len = data.read(2)
     if len(raw_len) < 2:
         raise ValueError("Not enough bytes to unpack string length.")
-    str_len = int.from_bytes(raw_len, BYTE_ORDER)
+    str_len = U16.unpack(raw_len)[0]
     raw_str = data.read(str_len)
     if len(raw_str) < str_len:
         raise ValueError("Not enough bytes to read full string.")
@@ -59,10 +166,19 @@ def unpack_string(data: BytesIO) -> str:
     except UnicodeDecodeError:
         raise ValueError("Invalid UTF-8 string.")
 
+def unpack_string_wire(data: BytesIO) -> Tuple[str, bytes]:
+    """
+    Same as unpack_string(), but also returns the length-prefixed bytes as read.
+    """
+    if isinstance(data, Cursor):
+        return data.read_string_wire()
+    text = unpack_string(data)
+    return text, pack_string(text)
+
 def pack_string(s: str) -> bytes:
     """
     Converts a string into MQTT's length-prefixed UTF-8 format.
     """
     encoded = s.encode('utf-8')
-    length_bytes = len(encoded).to_bytes(2, BYTE_ORDER)
+    length_bytes = U16.pack(len(encoded))
     return length_bytes + encoded
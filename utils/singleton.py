@@ -1,8 +1,15 @@
+import threading
+
+
 class Singleton(type):
     """class  Singleton"""
     _instances = {}
+    _lock = threading.RLock()  # re-entrant: singletons construct other singletons
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super().__call__(*args, **kwargs)
+            with cls._lock:
+                # Re-check under the lock: another thread may have created it meanwhile
+                if cls not in cls._instances:
+                    cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
\ No newline at end of file